@@ -1,16 +1,12 @@
 import openai
 import os 
+from collections import Counter
+from batch import RoutingStats, iter_classify
+from local_sentiment import LOCAL_CONFIDENCE_THRESHOLD
+from llm_client import usage  # token and cost totals of this run's API calls
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def llm_response(prompt):
-    response = openai.ChatCompletion.create(
-        model='gpt-3.5-turbo',
-        messages=[{'role':'user','content':prompt}],
-        temperature=0
-    )
-    return response.choices[0].message['content']
-
 all_reviews = [
     'The mochi is excellent!',
     'Best soup dumplings I have ever eaten.',
@@ -21,27 +17,19 @@ all_reviews = [
 
 all_reviews
 
+# Classified concurrently within the account's RPM/TPM limits; results keep the review order.
+# packed=True sends many numbered reviews per request instead of one request each.
+# Counts are kept while the labels arrive (see review_pipeline.py for large files).
+# Obvious reviews are labelled by the local lexicon classifier; only the rest reach the LLM
 all_sentiments = []
-for review in all_reviews:
-    prompt = f'''
-        Classify the following review 
-        as having either a positive or
-        negative sentiment. State your answer
-        as a single word, either "positive" or
-        "negative":
-
-        {review}
-        '''
-    response = llm_response(prompt)
-    all_sentiments.append(response)
+counts = Counter()
+routing = RoutingStats()
+for sentiment in iter_classify(all_reviews, packed=True, local_threshold=LOCAL_CONFIDENCE_THRESHOLD, stats=routing):
+    all_sentiments.append(sentiment)
+    counts[sentiment] += 1
 
 all_sentiments
 
-num_positive = 0
-num_negative = 0
-for sentiment in all_sentiments:
-    if sentiment == 'positive':
-        num_positive += 1
-    elif sentiment == 'negative':
-        num_negative += 1
-print(f"There are {num_positive} positive and {num_negative} negative reviews.")
\ No newline at end of file
+print(f"There are {counts['positive']} positive and {counts['negative']} negative reviews.")
+print(routing.summary())
+print(usage.summary())
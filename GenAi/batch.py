@@ -0,0 +1,291 @@
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import local_sentiment
+from llm_client import MODEL, AdaptiveConcurrency, estimate_tokens, llm_response
+
+# Account limits for MODEL; override to match your OpenAI tier
+REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM", "3500"))
+TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TPM", "90000"))
+
+MAX_WORKERS = int(os.getenv("OPENAI_MAX_WORKERS", "8"))
+
+# Labels are one word; this caps what the limiter reserves for the reply
+MAX_OUTPUT_TOKENS = 5
+
+# Packed mode: many numbered reviews per request, answered as a JSON array
+LABELS = ('positive', 'negative')
+CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+# Share of the context window a packed request may use; long packed prompts
+# degrade label quality well before the hard limit
+CONTEXT_UTILIZATION = 0.5
+MAX_PACKED_REVIEWS = int(os.getenv("MAX_PACKED_REVIEWS", "50"))
+# {"id": 12, "label": "negative"}, plus separators
+OUTPUT_TOKENS_PER_REVIEW = 12
+
+# Share of locally labelled reviews also sent to the LLM to measure agreement
+AUDIT_RATE = float(os.getenv("LOCAL_AUDIT_RATE", "0.05"))
+AUDIT_SEED = 0
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to `capacity`; acquire() blocks until enough are available."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.__rate = per_minute / 60.0
+        self.__capacity = capacity or per_minute
+        self.__available = float(self.__capacity)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # A request larger than the bucket would wait forever; let it drain the bucket instead
+        amount = min(amount, self.__capacity)
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__available = min(self.__capacity, self.__available + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__available >= amount:
+                    self.__available -= amount
+                    return
+                wait = (amount - self.__available) / self.__rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets shared by all workers."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+def chat_completion(prompt, limiter, model=MODEL, max_tokens=MAX_OUTPUT_TOKENS, concurrency=None):
+    """Single-message chat completion through the cached, rate-limited llm_client."""
+    return llm_response(prompt, model=model, max_tokens=max_tokens, limiter=limiter, concurrency=concurrency)
+
+
+def sentiment_prompt(review):
+    return f'''
+        Classify the following review
+        as having either a positive or
+        negative sentiment. State your answer
+        as a single word, either "positive" or
+        "negative":
+
+        {review}
+        '''
+
+
+def normalize_label(response):
+    """'Positive.' -> 'positive'"""
+    return response.strip().strip('."\'').lower()
+
+
+def classify_one(review, limiter, model=MODEL, concurrency=None):
+    return normalize_label(chat_completion(sentiment_prompt(review), limiter, model, concurrency=concurrency))
+
+
+PACKED_INSTRUCTIONS = '''Classify each numbered review below as having either a positive or negative sentiment.
+Answer with only a JSON array containing one object per review, in order:
+[{"id": 1, "label": "positive"}, {"id": 2, "label": "negative"}, ...]
+Each label must be either "positive" or "negative".
+
+Reviews:
+'''
+
+
+def packed_prompt(reviews):
+    """One prompt for many reviews: the instructions once, then one numbered line per review."""
+    lines = [f"{i}. {' '.join(str(review).split())}" for i, review in enumerate(reviews, start=1)]
+    return PACKED_INSTRUCTIONS + "\n".join(lines)
+
+
+def parse_packed_response(response, count):
+    """
+    Validates a packed answer and returns its labels in review order.
+
+    Raises ValueError unless the response holds a JSON array with exactly one
+    valid label for each id 1..count.
+    """
+    match = re.search(r'\[.*\]', response, flags=re.DOTALL)
+    if not match:
+        raise ValueError("no JSON array in response")
+    items = json.loads(match.group(0))
+    if len(items) != count:
+        raise ValueError(f"expected {count} answers, got {len(items)}")
+    labels = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"unexpected item {item!r}")
+        label = normalize_label(str(item.get('label', '')))
+        if label not in LABELS:
+            raise ValueError(f"invalid label {item.get('label')!r}")
+        review_id = int(item.get('id', 0))
+        if review_id in labels:
+            raise ValueError(f"duplicate id {review_id}")
+        labels[review_id] = label
+    if sorted(labels) != list(range(1, count + 1)):
+        raise ValueError(f"expected ids 1..{count}, got {sorted(labels)}")
+    return [labels[i] for i in range(1, count + 1)]
+
+
+def classify_packed(reviews, limiter, model=MODEL, concurrency=None):
+    """
+    Classifies a batch of reviews in one request. A batch whose answer fails
+    validation is split in half and retried; a single review falls back to
+    the one-review prompt.
+    """
+    if len(reviews) == 1:
+        return [classify_one(reviews[0], limiter, model, concurrency)]
+    response = chat_completion(packed_prompt(reviews), limiter, model,
+                               max_tokens=OUTPUT_TOKENS_PER_REVIEW * len(reviews) + 10, concurrency=concurrency)
+    try:
+        return parse_packed_response(response, len(reviews))
+    except (ValueError, TypeError):
+        middle = len(reviews) // 2
+        return (classify_packed(reviews[:middle], limiter, model, concurrency)
+                + classify_packed(reviews[middle:], limiter, model, concurrency))
+
+
+def pack_batches(reviews, model=MODEL, max_batch_size=MAX_PACKED_REVIEWS):
+    """
+    Groups an iterable of reviews into batches that fit the model's context
+    window (at CONTEXT_UTILIZATION, counting the expected answer) and hold
+    at most max_batch_size reviews.
+    """
+    budget = int(CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) * CONTEXT_UTILIZATION)
+    base = estimate_tokens(PACKED_INSTRUCTIONS, model) + 10
+    batch, used = [], base
+    for review in reviews:
+        cost = estimate_tokens(str(review), model) + 4 + OUTPUT_TOKENS_PER_REVIEW
+        if batch and (len(batch) >= max_batch_size or used + cost > budget):
+            yield batch
+            batch, used = [], base
+        batch.append(review)
+        used += cost
+    if batch:
+        yield batch
+
+
+class RoutingStats:
+    """How many reviews the local pre-classifier labelled, and how often the LLM agreed on the audited ones."""
+
+    def __init__(self):
+        self.total = 0
+        self.local = 0
+        self.llm = 0
+        self.audited = 0
+        self.agreed = 0
+
+    @property
+    def routing_rate(self):
+        """Share of reviews sent to the LLM for their label."""
+        return self.llm / self.total if self.total else 0.0
+
+    @property
+    def agreement(self):
+        """Share of audited local labels the LLM agreed with (None before any audit)."""
+        return self.agreed / self.audited if self.audited else None
+
+    def summary(self):
+        agreement = f"{self.agreement:.1%}" if self.agreement is not None else "n/a"
+        return (f"{self.local} of {self.total} reviews labelled locally, {self.llm} routed to the LLM "
+                f"({self.routing_rate:.1%}); local/LLM agreement {agreement} on {self.audited} audited")
+
+
+def iter_classify(reviews, limiter=None, max_workers=MAX_WORKERS, model=MODEL, packed=False,
+                  max_batch_size=MAX_PACKED_REVIEWS, local_threshold=None, audit_rate=AUDIT_RATE, stats=None,
+                  concurrency=None):
+    """
+    Classifies reviews on a pool of worker threads, yielding labels in input order.
+
+    reviews can be any iterable (e.g. a generator over a large file); at most
+    2 * max_workers requests are in flight or buffered at once. With
+    packed=True each request carries a batch of reviews (see pack_batches).
+
+    With local_threshold set, reviews the lexicon classifier labels with at
+    least that confidence skip the LLM; audit_rate of them are still sent to
+    it and compared. Pass a RoutingStats as stats to read the routing rate
+    and agreement afterwards.
+
+    Requests in flight adapt between 1 and max_workers (AIMD on 429s and the
+    rate-limit headers); pass an llm_client.AdaptiveConcurrency as
+    concurrency to share or inspect the limit.
+    """
+    if local_threshold is None:
+        yield from _iter_llm(reviews, limiter, max_workers, model, packed, max_batch_size, concurrency)
+        return
+
+    stats = stats if stats is not None else RoutingStats()
+    audit = random.Random(AUDIT_SEED)
+
+    def route():
+        for review in reviews:
+            label, confidence = local_sentiment.classify(review)
+            if label is not None and confidence >= local_threshold:
+                yield review, label, audit.random() < audit_rate
+            else:
+                yield review, None, True
+
+    routed, to_llm = itertools.tee(route())
+    llm_labels = _iter_llm((review for review, _, send in to_llm if send),
+                           limiter, max_workers, model, packed, max_batch_size, concurrency)
+    for review, local_label, send in routed:
+        stats.total += 1
+        llm_label = next(llm_labels) if send else None
+        if local_label is None:
+            stats.llm += 1
+            yield llm_label
+            continue
+        stats.local += 1
+        if send:
+            stats.audited += 1
+            stats.agreed += llm_label == local_label
+        yield local_label
+
+
+def _iter_llm(reviews, limiter, max_workers, model, packed, max_batch_size, concurrency=None):
+    """Ordered LLM labels for reviews; see iter_classify."""
+    limiter = limiter or RateLimiter()
+    concurrency = concurrency or AdaptiveConcurrency(max_workers)
+    if packed:
+        tasks = ((classify_packed, batch) for batch in pack_batches(reviews, model, max_batch_size))
+    else:
+        tasks = ((classify_packed, [review]) for review in reviews)
+
+    window = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for function, item in tasks:
+            window.append(executor.submit(function, item, limiter, model, concurrency))
+            if len(window) >= 2 * max_workers:
+                yield from window.popleft().result()
+        while window:
+            yield from window.popleft().result()
+
+
+def classify_reviews(reviews, limiter=None, max_workers=MAX_WORKERS, model=MODEL, packed=False,
+                     max_batch_size=MAX_PACKED_REVIEWS, local_threshold=None, audit_rate=AUDIT_RATE, stats=None,
+                     concurrency=None):
+    """Classifies reviews concurrently; returns labels in the same order as the reviews."""
+    return list(iter_classify(reviews, limiter, max_workers, model, packed, max_batch_size,
+                              local_threshold, audit_rate, stats, concurrency))
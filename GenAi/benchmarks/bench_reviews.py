@@ -0,0 +1,177 @@
+"""
+Offline throughput benchmark for the GenAi review classifier.
+
+Starts mock_openai_server in-process, points the openai client at it and
+classifies synthetic reviews through batch.classify_reviews at each
+combination of concurrency and batch size (1 = one review per request,
+larger values use packed prompts). Every case is printed as one JSON line
+with reviews/sec, p50/p95 request latency, requests, 429s, tokens per
+review, estimated cost and where the adaptive concurrency limit ended up
+(plus the LLM routing rate and local/LLM agreement with --local-threshold).
+The response cache is disabled so every case hits the server.
+
+Usage:
+    python bench_reviews.py
+    python bench_reviews.py --reviews 5000 --concurrency 4 16 64 --batch-sizes 1 20 50
+    python bench_reviews.py --latency-ms 800 --error-rate 0.02 --rpm 500 --tpm 200000
+    python bench_reviews.py --local-threshold 0.7       # include the local pre-classifier
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+# Must be set before llm_client is imported
+os.environ["LLM_CACHE"] = "off"
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+import openai  # noqa: E402
+
+import batch  # noqa: E402
+import llm_client  # noqa: E402
+from mock_openai_server import MockOpenAIServer  # noqa: E402
+
+OPENERS = ["The", "Our", "My", "This"]
+SUBJECTS = ["mochi", "soup dumplings", "pasta", "service", "waiter", "dessert", "wine list", "patio", "ramen", "bread"]
+VERDICTS = ["was excellent", "was cold", "was not worth the wait", "made me smile", "was bland", "was fine",
+            "was the best I have eaten", "was overpriced", "came quickly", "was really disappointing"]
+TAILS = ["", "!", " and I would come back.", ", but the room was noisy.", " Not bad at all.", " Never again."]
+
+
+def synthetic_reviews(count, seed):
+    """Unique review texts with a mix of clear and ambiguous sentiment."""
+    rng = random.Random(seed)
+    return [f"{rng.choice(OPENERS)} {rng.choice(SUBJECTS)} {rng.choice(VERDICTS)}{rng.choice(TAILS)} (#{i})"
+            for i in range(count)]
+
+
+class Recorder:
+    """Wraps openai.ChatCompletion.create to record per-request latency and token usage."""
+
+    def __init__(self):
+        self.__create = openai.ChatCompletion.create
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.failures = 0
+
+    def create(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.__create(*args, **kwargs)
+        except Exception:
+            with self.__lock:
+                self.failures += 1
+            raise
+        elapsed = time.perf_counter() - start
+        usage = response.get("usage", {})
+        with self.__lock:
+            self.latencies.append(elapsed)
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+        return response
+
+    def install(self):
+        openai.ChatCompletion.create = self.create
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def run_case(reviews, concurrency_limit, batch_size, recorder, server, args):
+    recorder.reset()
+    before = dict(server.stats)
+    stats = batch.RoutingStats()
+    limiter = batch.RateLimiter(args.client_rpm or args.rpm or 10 ** 9, args.client_tpm or args.tpm or 10 ** 12)
+    concurrency = llm_client.AdaptiveConcurrency(concurrency_limit, initial=args.initial_concurrency)
+
+    start = time.perf_counter()
+    labels = batch.classify_reviews(reviews, limiter=limiter, max_workers=concurrency_limit,
+                                    packed=batch_size > 1, max_batch_size=batch_size,
+                                    local_threshold=args.local_threshold, stats=stats, concurrency=concurrency)
+    seconds = time.perf_counter() - start
+
+    tokens = recorder.prompt_tokens + recorder.completion_tokens
+    cost = llm_client.estimate_cost(llm_client.MODEL, recorder.prompt_tokens, recorder.completion_tokens)
+    result = {
+        "concurrency": concurrency_limit,
+        "batch_size": batch_size,
+        "reviews": len(labels),
+        "seconds": round(seconds, 3),
+        "reviews_per_sec": round(len(labels) / seconds, 2) if seconds else None,
+        "requests": len(recorder.latencies),
+        "p50_ms": None if not recorder.latencies else round(percentile(recorder.latencies, 50) * 1000, 1),
+        "p95_ms": None if not recorder.latencies else round(percentile(recorder.latencies, 95) * 1000, 1),
+        "rate_limited": server.stats["rate_limited"] - before["rate_limited"],
+        "server_errors": server.stats["errors"] - before["errors"],
+        "prompt_tokens_per_review": round(recorder.prompt_tokens / len(labels), 2),
+        "completion_tokens_per_review": round(recorder.completion_tokens / len(labels), 2),
+        "tokens_per_review": round(tokens / len(labels), 2),
+        "cost_per_1k_reviews": None if cost is None else round(cost * 1000 / len(labels), 5),
+        "final_concurrency": concurrency.limit,
+        "concurrency_decreases": concurrency.decreases,
+    }
+    if args.local_threshold is not None:
+        result["llm_routing_rate"] = round(stats.routing_rate, 4)
+        result["local_agreement"] = None if stats.agreement is None else round(stats.agreement, 4)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark review classification against a mock OpenAI server")
+    parser.add_argument("--reviews", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50],
+                        help="reviews per request; 1 = unpacked prompts")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--per-token-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, help="server requests-per-minute limit")
+    parser.add_argument("--tpm", type=int, help="server tokens-per-minute limit")
+    parser.add_argument("--client-rpm", type=int, help="client limiter RPM (default: --rpm)")
+    parser.add_argument("--client-tpm", type=int, help="client limiter TPM (default: --tpm)")
+    parser.add_argument("--initial-concurrency", type=int,
+                        help="starting AIMD concurrency limit (default: the case's concurrency)")
+    parser.add_argument("--local-threshold", type=float, help="route through the local pre-classifier")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    reviews = synthetic_reviews(args.reviews, args.seed)
+    recorder = Recorder()
+    recorder.install()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        with MockOpenAIServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_token_ms=args.per_token_ms,
+                              error_rate=args.error_rate, rpm=args.rpm, tpm=args.tpm, seed=args.seed) as server:
+            openai.api_base = server.url
+            openai.api_key = openai.api_key or "mock"
+            for batch_size in args.batch_sizes:
+                for concurrency in args.concurrency:
+                    result = run_case(reviews, concurrency, batch_size, recorder, server, args)
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for benchmarks.
+
+Answers POST .../chat/completions with a chat.completion object after a
+configurable latency. Single-review prompts get a one-word label; packed
+prompts (numbered "1. ..." lines) get a JSON array of {id, label}. Labels
+come from a few cue phrases plus a seeded share of flipped labels, so they
+are deterministic but independent of the local lexicon classifier (whose
+audited labels are compared with the model's).
+
+It can inject 503 errors at a given rate and enforce requests- and
+tokens-per-minute limits, answering 429 with Retry-After and
+x-ratelimit-* headers like the real API.
+
+Usage:
+    python mock_openai_server.py --port 8000 --latency-ms 400 --rpm 3500 --tpm 90000
+    # then point the client at it:
+    OPENAI_API_BASE=http://127.0.0.1:8000/v1 python ../Reviews.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NUMBERED_LINE = re.compile(r'^(\d+)\. (.*)$', flags=re.MULTILINE)
+
+# A review mentioning any of these is negative, anything else positive
+NEGATIVE_CUES = ("cold", "not worth", "bland", "overpriced", "disappointing", "never again", "noisy",
+                 "terrible", "awful", "worst", "rude", "slow", "stale")
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+def label_for(text, label_noise=0.0, seed=0):
+    """Cue-phrase label, flipped for a label_noise share of texts chosen by hash."""
+    lowered = text.lower()
+    label = 'negative' if any(cue in lowered for cue in NEGATIVE_CUES) else 'positive'
+    draw = int(hashlib.sha1(f"{seed}|{text}".encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    if draw < label_noise:
+        label = 'positive' if label == 'negative' else 'negative'
+    return label
+
+
+def completion_content(prompt, label_noise=0.0, seed=0):
+    """One-word label, or a JSON array for packed prompts."""
+    items = NUMBERED_LINE.findall(prompt)
+    if len(items) > 1:
+        return json.dumps([{"id": int(i), "label": label_for(text, label_noise, seed)} for i, text in items])
+    return label_for(prompt, label_noise, seed)
+
+
+class MockOpenAIServer:
+    """ThreadingHTTPServer serving chat completions with latency, errors and rate limits."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=300.0, jitter_ms=100.0, per_token_ms=0.0,
+                 error_rate=0.0, rpm=None, tpm=None, seed=0, label_noise=0.05):
+        """
+        Args:
+            host, port: Address to bind; port 0 picks a free port
+            latency_ms: Base response latency
+            jitter_ms: Uniform random latency added on top (0..jitter_ms)
+            per_token_ms: Extra latency per completion token
+            error_rate: Share of requests answered with 503
+            rpm, tpm: Requests / tokens per minute before answering 429 (None = unlimited)
+            seed: Seed for jitter, error injection and label noise
+            label_noise: Share of reviews given the opposite of their cue-phrase label
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_token_ms = per_token_ms
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.tpm = tpm
+        self.seed = seed
+        self.label_noise = label_noise
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__window = deque()  # (timestamp, tokens) of accepted requests in the last minute
+        self.stats = {"requests": 0, "completed": 0, "rate_limited": 0, "errors": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without TCP_NODELAY
+            # the body waits for the client's delayed ACK (~40ms per response)
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self.__send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                status, payload, headers = server.handle_completion(body)
+                self.__send(status, payload, headers)
+
+            def __send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.__httpd = ThreadingHTTPServer((host, port), Handler)
+        self.__httpd.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__httpd.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__httpd.shutdown()
+        self.__httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def handle_completion(self, body):
+        """Returns (status, payload, headers) for one chat completion request."""
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = completion_content(prompt, self.label_noise, self.seed)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(content)
+        requested = prompt_tokens + (body.get("max_tokens") or completion_tokens)
+
+        with self.__lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self.__window and now - self.__window[0][0] >= 60:
+                self.__window.popleft()
+            used_requests = len(self.__window)
+            used_tokens = sum(tokens for _, tokens in self.__window)
+            limited = (self.rpm is not None and used_requests + 1 > self.rpm) or \
+                      (self.tpm is not None and used_tokens + requested > self.tpm)
+            if limited:
+                self.stats["rate_limited"] += 1
+                reset = 60 - (now - self.__window[0][0]) if self.__window else 1
+                return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, \
+                    self.__limit_headers(used_requests, used_tokens, retry_after=max(0.1, reset))
+            failed = self.__random.random() < self.error_rate
+            if not failed:
+                self.__window.append((now, requested))
+            delay = (self.latency_ms + self.__random.uniform(0, self.jitter_ms)
+                     + self.per_token_ms * completion_tokens) / 1000.0
+            headers = self.__limit_headers(used_requests + 1, used_tokens + requested)
+
+        time.sleep(delay)
+        if failed:
+            with self.__lock:
+                self.stats["errors"] += 1
+            return 503, {"error": {"message": "The server is overloaded", "type": "server_error"}}, {}
+
+        with self.__lock:
+            self.stats["completed"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }, headers
+
+    def __limit_headers(self, used_requests, used_tokens, retry_after=None):
+        headers = {}
+        if self.rpm is not None:
+            headers["x-ratelimit-limit-requests"] = str(self.rpm)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm - used_requests))
+        if self.tpm is not None:
+            headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm - used_tokens))
+        if retry_after is not None:
+            headers["retry-after"] = f"{retry_after:.2f}"
+        return headers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--per-token-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int)
+    parser.add_argument("--tpm", type=int)
+    parser.add_argument("--label-noise", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    server = MockOpenAIServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.per_token_ms,
+                              args.error_rate, args.rpm, args.tpm, label_noise=args.label_noise).start()
+    print(f"Mock OpenAI server listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Responses are deterministic at temperature 0, so identical requests can be
+# answered from disk. Entries expire after a TTL and the least recently used
+# ones are evicted once the cache holds more than max_entries.
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+
+# Eviction runs every this many writes rather than on each one
+EVICT_EVERY = 100
+
+
+def cache_key(model, messages, temperature, **params):
+    """Stable key for a chat request: model, sha256 of the messages, temperature and other parameters."""
+    messages_hash = hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+    extra = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(f"{model}|{messages_hash}|{temperature}|{extra}".encode('utf-8')).hexdigest()
+
+
+class _InFlight:
+    """Result slot shared by threads waiting for the same request."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LLMCache:
+    """SQLite-backed response cache with TTL, LRU eviction and in-flight deduplication."""
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.__ttl = ttl_seconds
+        self.__max_entries = max_entries
+        self.__lock = threading.Lock()
+        self.__in_flight = {}
+        self.__writes = 0
+        self.__connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Cached value, or None when missing or expired."""
+        with self.__lock:
+            return self.__lookup(key)
+
+    def set(self, key, value):
+        """Stores value under key; None is not cached, so the request is retried next time."""
+        if value is None:
+            return
+        now = time.time()
+        with self.__lock:
+            self.__connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self.__writes += 1
+            if self.__writes % EVICT_EVERY == 0:
+                self.__evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for key, or calls compute() and caches its
+        result. Concurrent callers with the same key wait for the first one
+        instead of sending duplicate requests.
+        """
+        with self.__lock:
+            value = self.__lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            slot = self.__in_flight.get(key)
+            owner = slot is None
+            if owner:
+                slot = self.__in_flight[key] = _InFlight()
+                self.misses += 1
+
+        if not owner:
+            slot.done.wait()
+            if slot.error is not None:
+                raise slot.error
+            with self.__lock:
+                self.hits += 1
+            return slot.value
+
+        try:
+            slot.value = compute()
+            self.set(key, slot.value)
+            return slot.value
+        except Exception as e:
+            slot.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__in_flight[key]
+            slot.done.set()
+
+    def clear(self):
+        with self.__lock:
+            self.__connection.execute("DELETE FROM responses")
+
+    def __lookup(self, key):
+        """get() without taking the lock; callers hold it."""
+        now = time.time()
+        row = self.__connection.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.__ttl:
+            self.__connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self.__connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def __evict(self):
+        """Drop expired entries, then the least recently used ones above max_entries. Caller holds the lock."""
+        self.__connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.__ttl,))
+        count = self.__connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.__max_entries:
+            self.__connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (count - self.__max_entries,)
+            )
@@ -0,0 +1,328 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+import openai
+
+from llm_cache import LLMCache, cache_key
+
+try:
+    import tiktoken
+except ImportError:  # optional; falls back to a character-based estimate
+    tiktoken = None
+
+openai.api_key = os.getenv("OPENAI_API_KEY")
+
+MODEL = 'gpt-3.5-turbo'
+
+MAX_RETRIES = 6
+MAX_BACKOFF_SECONDS = 60
+
+# USD per 1M (prompt, completion) tokens; update when OpenAI changes its prices
+PRICING = {
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gpt-4': (30.00, 60.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+}
+
+# AIMD: +1 concurrent request per window of successes, halve on a 429, and
+# stop growing once less than this share of the minute's quota is left
+CONCURRENCY_DECREASE_FACTOR = 0.5
+LOW_QUOTA_SHARE = 0.1
+# Weight of the newest sample in the smoothed round-trip time
+RTT_SMOOTHING = 0.125
+
+# Outcomes reported to AdaptiveConcurrency.release()
+SUCCESS = 'success'
+RATE_LIMITED = 'rate_limited'
+ERROR = 'error'
+
+logger = logging.getLogger(__name__)
+
+# Set LLM_CACHE=off to always call the API
+cache = LLMCache() if os.getenv("LLM_CACHE", "on").lower() != "off" else None
+
+
+def estimate_tokens(text, model=MODEL):
+    """Token count with tiktoken when installed, else about 4 characters per token."""
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(model).encode(text))
+        except KeyError:
+            pass
+    return len(text) // 4 + 1
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """USD cost of a call from PRICING (dated model names match their base model); None for unknown models."""
+    prices = PRICING.get(model) or next((PRICING[m] for m in sorted(PRICING, key=len, reverse=True)
+                                         if model.startswith(m + '-')), None)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class UsageTracker:
+    """Thread-safe running totals of API calls, tokens and estimated cost, per model."""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__last = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__models = defaultdict(lambda: {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            self.__started = time.monotonic()
+
+    def record(self, model, prompt_tokens, completion_tokens, latency):
+        """Adds one call and returns its usage record."""
+        call = {
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost': estimate_cost(model, prompt_tokens, completion_tokens),
+            'latency_ms': round(latency * 1000, 1)
+        }
+        with self.__lock:
+            totals = self.__models[model]
+            totals['calls'] += 1
+            totals['prompt_tokens'] += prompt_tokens
+            totals['completion_tokens'] += completion_tokens
+        self.__last.call = call
+        return call
+
+    def last_call(self):
+        """Usage record of the most recent API call made by the current thread (None if none)."""
+        return getattr(self.__last, 'call', None)
+
+    def by_model(self):
+        with self.__lock:
+            models = {model: dict(totals) for model, totals in self.__models.items()}
+        for model, totals in models.items():
+            totals['cost'] = estimate_cost(model, totals['prompt_tokens'], totals['completion_tokens'])
+        return models
+
+    def totals(self):
+        """Aggregate calls, tokens, cost (None if any model is unpriced) and tokens per minute."""
+        models = self.by_model()
+        totals = {key: sum(m[key] for m in models.values()) for key in ('calls', 'prompt_tokens', 'completion_tokens')}
+        costs = [m['cost'] for m in models.values()]
+        totals['cost'] = None if None in costs else sum(costs)
+        minutes = (time.monotonic() - self.__started) / 60
+        totals['tokens_per_minute'] = (totals['prompt_tokens'] + totals['completion_tokens']) / minutes if minutes else 0.0
+        return totals
+
+    def summary(self):
+        t = self.totals()
+        cost = f"${t['cost']:.4f}" if t['cost'] is not None else "unknown cost"
+        return (f"{t['calls']} API calls, {t['prompt_tokens']} prompt + {t['completion_tokens']} completion tokens "
+                f"({t['tokens_per_minute']:.0f} tokens/min), {cost}")
+
+
+# Every call made through this module is recorded here
+usage = UsageTracker()
+
+
+class AdaptiveConcurrency:
+    """
+    Caps concurrent API calls with additive-increase / multiplicative-decrease.
+
+    Each success raises the limit by 1/limit (about one more slot per round
+    of requests) until the rate-limit headers show less than LOW_QUOTA_SHARE
+    of the quota left; a 429 multiplies it by CONCURRENCY_DECREASE_FACTOR.
+    Other errors (503s, timeouts) only free their slot.
+    A decrease opens a recovery window of one smoothed round-trip time, or
+    the 429's Retry-After if longer: 429s received inside it, or from requests
+    started before the decrease, belong to the same event and are ignored, so
+    an exhausted quota halves the limit once rather than collapsing it.
+    """
+
+    def __init__(self, maximum, initial=None, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.__limit = float(min(initial or maximum, maximum))
+        self.__active = 0
+        self.__decreased_at = float('-inf')
+        self.__recovery_until = float('-inf')
+        self.__rtt = 0.0
+        self.__condition = threading.Condition()
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def limit(self):
+        return int(self.__limit)
+
+    @property
+    def rtt(self):
+        """Smoothed latency of successful requests, in seconds."""
+        return self.__rtt
+
+    def acquire(self):
+        """Blocks until a slot is free; returns a ticket (the start time) for release()."""
+        with self.__condition:
+            while self.__active >= int(self.__limit):
+                self.__condition.wait()
+            self.__active += 1
+            return time.monotonic()
+
+    def release(self, ticket, outcome, headers=None):
+        """
+        Frees the slot taken by acquire() and adapts the limit.
+
+        Args:
+            ticket: Value returned by acquire()
+            outcome: SUCCESS, RATE_LIMITED (a 429) or ERROR (any other failure)
+            headers: Response headers, read for x-ratelimit-remaining-*
+        """
+        now = time.monotonic()
+        with self.__condition:
+            self.__active -= 1
+            if outcome == RATE_LIMITED:
+                if ticket >= self.__decreased_at and now >= self.__recovery_until:
+                    self.__limit = max(self.minimum, self.__limit * CONCURRENCY_DECREASE_FACTOR)
+                    self.__decreased_at = now
+                    self.__recovery_until = now + max(self.__rtt, retry_after_header(headers) or 0.0)
+                    self.decreases += 1
+                    logger.info("429 received; concurrency limit lowered to %d", self.limit)
+            elif outcome == SUCCESS:
+                # Same smoothing as TCP's SRTT
+                latency = now - ticket
+                self.__rtt = latency if not self.__rtt else (1 - RTT_SMOOTHING) * self.__rtt + RTT_SMOOTHING * latency
+                if not quota_low(headers) and self.__limit < self.maximum:
+                    self.__limit = min(self.maximum, self.__limit + 1 / self.__limit)
+                    self.increases += 1
+            self.__condition.notify_all()
+
+
+def quota_low(headers):
+    """True if x-ratelimit-* headers show less than LOW_QUOTA_SHARE of requests or tokens left."""
+    if not headers:
+        return False
+    for kind in ('requests', 'tokens'):
+        try:
+            limit = float(headers[f'x-ratelimit-limit-{kind}'])
+            remaining = float(headers[f'x-ratelimit-remaining-{kind}'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if limit and remaining / limit < LOW_QUOTA_SHARE:
+            return True
+    return False
+
+
+# openai 0.x drops the HTTP headers of successful responses; a response hook
+# on each thread's session keeps the last ones so rate-limit headers are
+# visible after every call, not only on errors
+_last_headers = threading.local()
+
+
+def _remember_headers(response, *args, **kwargs):
+    _last_headers.value = response.headers
+
+
+def _make_session():
+    import requests
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(max_retries=2))
+    session.hooks['response'].append(_remember_headers)
+    return session
+
+
+if hasattr(openai, 'requestssession') and openai.requestssession is None:
+    openai.requestssession = _make_session
+
+
+def response_headers():
+    """Headers of the last HTTP response received on this thread (empty if unknown)."""
+    return getattr(_last_headers, 'value', None) or {}
+
+
+def retry_after_header(headers):
+    """Retry-After in seconds, or None when absent or not a number."""
+    try:
+        return float((headers or {})['retry-after'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after(error, attempt):
+    """Seconds to wait before retrying: the server's Retry-After if given, else jittered exponential backoff."""
+    seconds = retry_after_header(getattr(error, 'headers', None))
+    if seconds is not None:
+        return seconds
+    return min(MAX_BACKOFF_SECONDS, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _create(messages, model, temperature, max_tokens, limiter, concurrency, tracker):
+    """
+    Calls the API, waiting for the rate limiter and a concurrency slot and
+    retrying 429s and transient errors with backoff. Token usage is added to
+    the module's usage tracker (and tracker, if given).
+    """
+    params = {'max_tokens': max_tokens} if max_tokens else {}
+    for attempt in range(MAX_RETRIES):
+        if limiter is not None:
+            limiter.acquire(sum(estimate_tokens(m['content'], model) for m in messages) + (max_tokens or 0))
+        ticket = concurrency.acquire() if concurrency is not None else None
+        outcome = ERROR
+        start = time.monotonic()
+        try:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **params
+            )
+        except (openai.error.RateLimitError, openai.error.ServiceUnavailableError, openai.error.Timeout) as e:
+            if isinstance(e, openai.error.RateLimitError):
+                outcome = RATE_LIMITED
+            if attempt == MAX_RETRIES - 1:
+                raise
+            wait = retry_after(e, attempt)
+        else:
+            outcome = SUCCESS
+            counts = response.get('usage') or {}
+            prompt_tokens = counts.get('prompt_tokens', 0)
+            completion_tokens = counts.get('completion_tokens', 0)
+            latency = time.monotonic() - start
+            call = usage.record(model, prompt_tokens, completion_tokens, latency)
+            if tracker is not None:
+                tracker.record(model, prompt_tokens, completion_tokens, latency)
+            logger.debug("%s call: %s", model, call)
+            return response.choices[0].message['content']
+        finally:
+            if concurrency is not None:
+                concurrency.release(ticket, outcome, response_headers())
+        time.sleep(wait)
+
+
+def chat_completion(messages, model=MODEL, temperature=0, max_tokens=None, limiter=None, concurrency=None,
+                    tracker=None):
+    """
+    Chat completion content for a list of messages.
+
+    Requests at temperature 0 are answered from the response cache when
+    possible, and identical concurrent requests share one API call; cached
+    answers use no tokens and are not recorded as usage.
+    limiter is an optional batch.RateLimiter and concurrency an optional
+    AdaptiveConcurrency, both shared across threads. tracker is an extra
+    UsageTracker, e.g. for one run, on top of the module-wide usage.
+    """
+    def create():
+        return _create(messages, model, temperature, max_tokens, limiter, concurrency, tracker)
+
+    if cache is None or temperature != 0:
+        return create()
+    key = cache_key(model, messages, temperature, max_tokens=max_tokens)
+    return cache.get_or_compute(key, create)
+
+
+def llm_response(prompt, model=MODEL, temperature=0, max_tokens=None, limiter=None, concurrency=None, tracker=None):
+    return chat_completion([{'role': 'user', 'content': prompt}], model, temperature, max_tokens, limiter,
+                           concurrency, tracker)
@@ -0,0 +1,119 @@
+import math
+import re
+
+# CPU-only lexicon sentiment scorer used to label obvious reviews before they
+# reach the LLM. classify() returns (label, confidence); confidence is low for
+# short, weak or mixed-signal text so only those are routed to the model.
+
+# Reviews at or above this confidence are labelled locally
+LOCAL_CONFIDENCE_THRESHOLD = 0.7
+
+POSITIVE = {
+    # strong
+    'excellent': 3, 'amazing': 3, 'outstanding': 3, 'fantastic': 3, 'wonderful': 3, 'best': 3, 'perfect': 3,
+    'superb': 3, 'incredible': 3, 'exceptional': 3, 'delicious': 3, 'love': 3, 'loved': 3, 'awesome': 3,
+    'phenomenal': 3, 'brilliant': 3, 'favorite': 3, 'favourite': 3, 'heavenly': 3, 'divine': 3,
+    # moderate
+    'great': 2, 'good': 2, 'tasty': 2, 'friendly': 2, 'fresh': 2, 'recommend': 2, 'recommended': 2,
+    'enjoyed': 2, 'enjoy': 2, 'happy': 2, 'pleasant': 2, 'lovely': 2, 'beautiful': 2, 'smile': 2,
+    'impressed': 2, 'worth': 2, 'attentive': 2, 'helpful': 2, 'satisfied': 2, 'yummy': 2, 'cozy': 2,
+    'generous': 2, 'flavorful': 2, 'delightful': 2, 'charming': 2, 'perfectly': 2, 'liked': 2, 'like': 1,
+    # mild
+    'nice': 1, 'fine': 1, 'decent': 1, 'clean': 1, 'quick': 1, 'fast': 1, 'colorful': 1, 'warm': 1,
+    'reasonable': 1, 'affordable': 1, 'solid': 1, 'ok': 0.5, 'okay': 0.5,
+}
+
+NEGATIVE = {
+    # strong
+    'terrible': 3, 'awful': 3, 'horrible': 3, 'worst': 3, 'disgusting': 3, 'inedible': 3, 'hate': 3,
+    'hated': 3, 'rude': 3, 'disappointing': 3, 'disappointed': 3, 'poisoning': 3, 'gross': 3,
+    'nasty': 3, 'appalling': 3, 'dreadful': 3, 'unacceptable': 3, 'filthy': 3, 'rip-off': 3,
+    # moderate
+    'bad': 2, 'poor': 2, 'cold': 1, 'bland': 2, 'overpriced': 2, 'slow': 2, 'dirty': 2, 'stale': 2,
+    'soggy': 2, 'greasy': 2, 'burnt': 2, 'undercooked': 2, 'overcooked': 2, 'wait': 1, 'waited': 1,
+    'mediocre': 2, 'salty': 1, 'noisy': 1, 'crowded': 1, 'expensive': 1, 'dry': 1, 'tasteless': 2,
+    'unfriendly': 2, 'sick': 2, 'wrong': 2, 'lukewarm': 2, 'ignored': 2, 'boring': 2, 'meh': 1,
+    'avoid': 3, 'waste': 3, 'refund': 2, 'complaint': 2, 'broken': 2, 'small': 1, 'tiny': 1,
+}
+
+NEGATORS = {'not', 'no', 'never', 'nothing', 'hardly', 'barely', 'without', 'neither', 'nor'}
+INTENSIFIERS = {'very': 1.5, 'really': 1.4, 'so': 1.4, 'extremely': 1.8, 'incredibly': 1.8, 'super': 1.5,
+                'absolutely': 1.8, 'truly': 1.4, 'totally': 1.5, 'quite': 1.2, 'too': 1.3}
+DAMPENERS = {'slightly': 0.5, 'somewhat': 0.6, 'bit': 0.6, 'kinda': 0.6, 'fairly': 0.8}
+
+# A negator flips the polarity of the next few words, slightly weakened
+NEGATION_WINDOW = 3
+NEGATION_FACTOR = -0.75
+# Clauses after a contrast word carry the writer's actual verdict
+CONTRAST_WORDS = {'but', 'however', 'although', 'though', 'yet'}
+CONTRAST_BEFORE, CONTRAST_AFTER = 0.5, 1.5
+EXCLAMATION_BOOST = 1.2
+# Score at which confidence reaches ~63%
+CONFIDENCE_SCALE = 2.0
+
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:-[a-z]+)*(?:'[a-z]+)?|[!?.,;]")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def score(text):
+    """
+    Returns (positive, negative) evidence for a review. Negators flip the next
+    NEGATION_WINDOW words, intensifiers scale the next word and words before a
+    contrast ("but", "however") count less than words after it.
+    """
+    tokens = tokenize(text)
+    exclaim = EXCLAMATION_BOOST if '!' in tokens else 1.0
+    contrast = next((i for i, t in enumerate(tokens) if t in CONTRAST_WORDS), None)
+
+    positive = negative = 0.0
+    negated_until = -1
+    multiplier = 1.0
+    for i, token in enumerate(tokens):
+        if token in NEGATORS or token.endswith("n't"):
+            negated_until = i + NEGATION_WINDOW
+            continue
+        if token in ('.', ',', ';', '?', '!'):
+            negated_until = -1
+            multiplier = 1.0
+            continue
+        if token in INTENSIFIERS:
+            multiplier = INTENSIFIERS[token]
+            continue
+        if token in DAMPENERS:
+            multiplier = DAMPENERS[token]
+            continue
+
+        weight = POSITIVE.get(token, 0) - NEGATIVE.get(token, 0)
+        if not weight:
+            continue
+        weight *= multiplier * exclaim
+        multiplier = 1.0
+        if i <= negated_until:
+            weight *= NEGATION_FACTOR
+        if contrast is not None:
+            weight *= CONTRAST_AFTER if i > contrast else CONTRAST_BEFORE
+
+        if weight > 0:
+            positive += weight
+        else:
+            negative -= weight
+    return positive, negative
+
+
+def classify(text):
+    """
+    Returns (label, confidence) where label is 'positive' or 'negative' (None
+    without any sentiment words) and confidence is in [0, 1). Confidence grows
+    with the net score and shrinks when both polarities are present.
+    """
+    positive, negative = score(text)
+    total = positive + negative
+    if total == 0:
+        return None, 0.0
+    net = positive - negative
+    agreement = abs(net) / total
+    confidence = (1 - math.exp(-abs(net) / CONFIDENCE_SCALE)) * agreement
+    return ('positive' if net > 0 else 'negative'), confidence
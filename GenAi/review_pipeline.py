@@ -0,0 +1,171 @@
+"""
+Streaming sentiment classification for large review exports.
+
+Reads reviews lazily from CSV or JSONL (optionally gzipped), classifies them
+through the batch engine, appends one JSON line per review to the output and
+checkpoints after every chunk. Re-running the same command resumes after the
+last checkpoint; label counts are kept as a running total.
+
+Usage:
+    python review_pipeline.py reviews.csv labels.jsonl --column review_text --id-column review_id
+    python review_pipeline.py reviews.jsonl.gz labels.jsonl --packed --workers 16
+    python review_pipeline.py reviews.csv labels.jsonl --restart     # ignore an existing checkpoint
+"""
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from batch import AUDIT_RATE, MAX_WORKERS, RateLimiter, RoutingStats, iter_classify
+from llm_client import usage
+
+CHUNK_SIZE = 1000
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def read_reviews(path, column='review', id_column=None):
+    """
+    Yields {"id", "review"} records one at a time from a .csv or .jsonl file
+    (plain or .gz). The id is id_column's value, or the record number.
+    """
+    with open_text(path) as f:
+        if '.jsonl' in path or '.ndjson' in path:
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for number, row in enumerate(rows):
+            if column not in row:
+                raise KeyError(f"Column '{column}' not found in {path} (record {number})")
+            yield {"id": row[id_column] if id_column else number, "review": row[column] or ''}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """Writes the checkpoint atomically, so a crash leaves either the old or the new one."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run(input_path, output_path, column='review', id_column=None, checkpoint_path=None, restart=False,
+        chunk_size=CHUNK_SIZE, packed=False, max_workers=MAX_WORKERS, include_text=False, limiter=None,
+        local_threshold=None, audit_rate=AUDIT_RATE):
+    """
+    Classifies every review of input_path into output_path (JSON lines of
+    {"id", "label"}, plus "review" with include_text). With local_threshold,
+    confident reviews are labelled by the local pre-classifier.
+
+    Returns:
+        {"processed": int, "counts": {label: int}, "routing": RoutingStats for this run}
+    """
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint.json"
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint and checkpoint.get("input") != os.path.abspath(input_path):
+        raise ValueError(f"{checkpoint_path} belongs to {checkpoint.get('input')}; use --restart or another output")
+
+    processed = checkpoint["processed"] if checkpoint else 0
+    counts = Counter(checkpoint["counts"] if checkpoint else {})
+
+    if checkpoint and not os.path.exists(output_path):
+        raise ValueError(f"{output_path} is missing but {checkpoint_path} exists; use --restart")
+
+    # Drop anything written after the last checkpoint; those reviews are redone
+    with open(output_path, 'r+b' if checkpoint else 'wb') as out:
+        if checkpoint:
+            out.truncate(checkpoint["output_bytes"])
+            out.seek(checkpoint["output_bytes"])
+
+        records = itertools.islice(read_reviews(input_path, column, id_column), processed, None)
+        records, texts = itertools.tee(records)
+        routing = RoutingStats()
+        labels = iter_classify((record["review"] for record in texts), limiter=limiter or RateLimiter(),
+                               max_workers=max_workers, packed=packed, local_threshold=local_threshold,
+                               audit_rate=audit_rate, stats=routing)
+
+        started, resumed_at, since_checkpoint = time.monotonic(), processed, 0
+        for record, label in zip(records, labels):
+            line = {"id": record["id"], "label": label}
+            if include_text:
+                line["review"] = record["review"]
+            out.write((json.dumps(line) + '\n').encode('utf-8'))
+            counts[label] += 1
+            processed += 1
+            since_checkpoint += 1
+
+            if since_checkpoint >= chunk_size:
+                out.flush()
+                os.fsync(out.fileno())
+                save_checkpoint(checkpoint_path, {
+                    "input": os.path.abspath(input_path),
+                    "processed": processed,
+                    "output_bytes": out.tell(),
+                    "counts": counts
+                })
+                since_checkpoint = 0
+                rate = (processed - resumed_at) / max(time.monotonic() - started, 1e-9)
+                print(f"{processed} reviews classified ({rate:.1f}/s) {dict(counts)}", file=sys.stderr)
+
+        out.flush()
+        os.fsync(out.fileno())
+        save_checkpoint(checkpoint_path, {
+            "input": os.path.abspath(input_path),
+            "processed": processed,
+            "output_bytes": out.tell(),
+            "counts": counts,
+            "complete": True
+        })
+
+    return {"processed": processed, "counts": dict(counts), "routing": routing}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify review sentiment for large CSV/JSONL files")
+    parser.add_argument("input", help=".csv or .jsonl file, optionally .gz")
+    parser.add_argument("output", help="JSON lines output; appended to when resuming")
+    parser.add_argument("--column", default="review", help="column/field holding the review text")
+    parser.add_argument("--id-column", help="column/field to copy into the output (default: record number)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint and start over")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="reviews between checkpoints")
+    parser.add_argument("--packed", action="store_true", help="send many reviews per request")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--include-text", action="store_true", help="copy the review text into the output")
+    parser.add_argument("--local-threshold", type=float,
+                        help="label reviews locally at or above this lexicon confidence (e.g. 0.7)")
+    parser.add_argument("--audit-rate", type=float, default=AUDIT_RATE,
+                        help="share of locally labelled reviews also sent to the LLM to measure agreement")
+    args = parser.parse_args(argv)
+
+    result = run(args.input, args.output, args.column, args.id_column, args.checkpoint, args.restart,
+                 args.chunk_size, args.packed, args.workers, args.include_text,
+                 local_threshold=args.local_threshold, audit_rate=args.audit_rate)
+    counts = result["counts"]
+    print(f"There are {counts.get('positive', 0)} positive and {counts.get('negative', 0)} negative reviews "
+          f"({result['processed']} classified).")
+    if args.local_threshold is not None:
+        print(result["routing"].summary())
+    print(usage.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
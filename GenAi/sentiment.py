@@ -1,23 +1,21 @@
 import openai
 import os
+from llm_client import llm_response  # cached; re-runs and repeated prompts are answered from disk
+from local_sentiment import LOCAL_CONFIDENCE_THRESHOLD, classify as classify_local
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-def llm_response(prompt):
-    response = openai.ChatCompletion.create(
-        model='gpt-3.5-turbo',
-        messages=[{'role':'user','content':prompt}],
-        temperature=0
-    )
-    return response.choices[0].message['content']
+review = 'Tell me something that is black and beautiful - Niggas'
 
-prompt = '''
+prompt = f'''
     Classify the following review 
     as having either a positive or
     negative sentiment:
 
-    Tell me something that is black and beautiful - Niggas
+    {review}
 '''
 
-response = llm_response(prompt)
+# Obvious reviews are labelled by the local lexicon classifier; only ambiguous ones reach the LLM
+label, confidence = classify_local(review)
+response = label if confidence >= LOCAL_CONFIDENCE_THRESHOLD else llm_response(prompt)
 print(response)
\ No newline at end of file
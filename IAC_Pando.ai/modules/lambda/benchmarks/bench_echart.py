@@ -0,0 +1,248 @@
+"""
+Benchmark and regression suite for freight_audit/echart.py.
+
+Generates synthetic Athena-style result sets (all values are strings, as
+returned by execute_query) and times data_to_echart (use_ai=False), every
+function in chart_formatters, the axis identifiers and the local chart
+classifier. Each case reports wall time and peak traced memory as one JSON
+object per line.
+
+Thresholds live in echart_thresholds.json, keyed "function/shape/rows", for
+every size from 10 to 1M rows. They are machine dependent; re-record them with
+--write-thresholds when the reference machine changes. format_categorical
+grows with rows x categories; its larger sizes are skipped whenever their
+projected time exceeds --budget, so it has no threshold at those sizes.
+
+Usage:
+    python bench_echart.py                              # run and print results
+    python bench_echart.py --check                      # fail on regressions
+    python bench_echart.py --write-thresholds           # record a new baseline
+    python bench_echart.py --sizes 10 1000 --shapes time_series
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "freight_audit"))
+
+import echart  # noqa: E402
+
+DEFAULT_SIZES = [10, 1_000, 10_000, 100_000, 1_000_000]
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "echart_thresholds.json")
+
+# A case is flagged when it is this much slower / larger than its threshold
+DEFAULT_TOLERANCE = 0.5
+
+# Larger sizes of a case are skipped when the projection of the last measured
+# size exceeds this many seconds
+DEFAULT_BUDGET_SECONDS = 60.0
+
+# Projected quadratically; every other function is linear in the row count
+QUADRATIC_FUNCTIONS = {"format_categorical"}
+
+
+def _money(rng: random.Random) -> str:
+    return f"{rng.uniform(10, 50000):,.2f}"
+
+
+def category_value(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """One low-cardinality label column and one numeric column."""
+    lanes = [f"LANE-{i:03d}" for i in range(25)]
+    return [{"lane": rng.choice(lanes), "freight_cost": _money(rng)} for _ in range(n)]
+
+
+def part_to_whole(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Few categories with a percentage share column."""
+    carriers = ["UPS", "FedEx", "DHL", "Maersk", "MSC", "CMA CGM"]
+    return [{"carrier": rng.choice(carriers), "pct_share": str(rng.randint(1, 40))} for _ in range(n)]
+
+
+def time_series(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """A daily date column (one row per day) with two measures."""
+    start = date(2000, 1, 1)
+    return [
+        {
+            "invoice_date": (start + timedelta(days=i)).isoformat(),
+            "total_cost": _money(rng),
+            "shipment_count": str(rng.randint(0, 500))
+        }
+        for i in range(n)
+    ]
+
+
+def category_time_value(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Month x transport mode x value, the shape of comparative charts."""
+    months = [f"2024-{m:02d}" for m in range(1, 13)]
+    modes = ["air", "ocean", "road", "rail"]
+    return [
+        {"invoice_month": rng.choice(months), "mode": rng.choice(modes), "total_cost": _money(rng)}
+        for _ in range(n)
+    ]
+
+
+def high_cardinality(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Unique identifiers with a value column (no good category axis)."""
+    return [{"invoice_id": f"INV-{i:09d}", "amount": _money(rng), "status": rng.choice(["PAID", "OPEN"])}
+            for i in range(n)]
+
+
+def wide_numeric(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """A label column followed by eight numeric measures."""
+    regions = ["NA", "EMEA", "APAC", "LATAM"]
+    rows = []
+    for _ in range(n):
+        row = {"region": rng.choice(regions)}
+        for m in range(8):
+            row[f"metric_{m}"] = str(rng.randint(0, 10000))
+        rows.append(row)
+    return rows
+
+
+SHAPES: Dict[str, Callable[[int, random.Random], List[Dict[str, Any]]]] = {
+    "category_value": category_value,
+    "part_to_whole": part_to_whole,
+    "time_series": time_series,
+    "category_time_value": category_time_value,
+    "high_cardinality": high_cardinality,
+    "wide_numeric": wide_numeric,
+}
+
+
+def _functions() -> Dict[str, Callable[[List[Dict[str, Any]]], Any]]:
+    functions = {"data_to_echart": lambda data: echart.data_to_echart(data, use_ai=False)}
+    for chart_type, formatter in echart.chart_formatters.items():
+        functions[f"format_{chart_type}"] = lambda data, formatter=formatter: formatter(data, None)
+    functions["identify_axes"] = echart.identify_axes
+    functions["identify_value_and_name_columns"] = echart.identify_value_and_name_columns
+    functions["classify_chart"] = echart.classify_chart
+    return functions
+
+
+def _run_quietly(func: Callable, data: List[Dict[str, Any]]) -> None:
+    # The formatters print every x value; keep that out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(data)
+
+
+def measure(func: Callable, data: List[Dict[str, Any]], track_memory: bool) -> Dict[str, Any]:
+    """Times one call and, optionally, repeats it under tracemalloc for peak memory."""
+    start = time.perf_counter()
+    _run_quietly(func, data)
+    seconds = time.perf_counter() - start
+
+    peak_mib = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            _run_quietly(func, data)
+            peak_mib = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return {"seconds": round(seconds, 6), "peak_mib": None if peak_mib is None else round(peak_mib, 3)}
+
+
+def case_id(function: str, shape: str, rows: int) -> str:
+    return f"{function}/{shape}/{rows}"
+
+
+def check_case(result: Dict[str, Any], thresholds: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns the metrics of a measured case that exceed its threshold."""
+    limit = thresholds.get(case_id(result["function"], result["shape"], result["rows"]))
+    if not limit or result["status"] != "ok":
+        return []
+    regressions = []
+    for metric in ("seconds", "peak_mib"):
+        if result.get(metric) is not None and limit.get(metric) is not None:
+            if result[metric] > limit[metric] * (1 + tolerance):
+                regressions.append(metric)
+    return regressions
+
+
+def run(sizes: List[int], shapes: List[str], functions: List[str], thresholds: Dict[str, Any],
+        tolerance: float, budget: float, track_memory: bool, seed: int, out) -> List[Dict[str, Any]]:
+    available = _functions()
+    results = []
+    for shape in shapes:
+        datasets = {}
+        last = {}  # function -> (rows, seconds) of the last measured size
+        for rows in sorted(sizes):
+            for function in functions:
+                result = {"function": function, "shape": shape, "rows": rows}
+                previous = last.get(function)
+                exponent = 2 if function in QUADRATIC_FUNCTIONS else 1
+                if previous and previous[1] * (rows / previous[0]) ** exponent > budget:
+                    result.update({"status": "skipped", "seconds": None, "peak_mib": None})
+                else:
+                    if rows not in datasets:
+                        datasets.clear()
+                        datasets[rows] = SHAPES[shape](rows, random.Random(seed))
+                    try:
+                        result.update(measure(available[function], datasets[rows], track_memory))
+                        result["status"] = "ok"
+                        last[function] = (rows, result["seconds"])
+                    except Exception as e:
+                        result.update({"status": "error", "error": str(e), "seconds": None, "peak_mib": None})
+                result["regressions"] = check_case(result, thresholds, tolerance)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                results.append(result)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark echart.py formatters")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument("--functions", nargs="+", choices=sorted(_functions()), default=list(_functions()))
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any case regresses")
+    parser.add_argument("--write-thresholds", action="store_true",
+                        help="store 2x the measured values as the new thresholds")
+    args = parser.parse_args(argv)
+
+    thresholds = {}
+    if os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        results = run(args.sizes, args.shapes, args.functions, thresholds, args.tolerance,
+                      args.budget, not args.no_memory, args.seed, out)
+    finally:
+        if args.output:
+            out.close()
+
+    if args.write_thresholds:
+        for result in results:
+            if result["status"] == "ok":
+                thresholds[case_id(result["function"], result["shape"], result["rows"])] = {
+                    "seconds": round(max(result["seconds"] * 2, 0.001), 4),
+                    "peak_mib": None if result["peak_mib"] is None else round(max(result["peak_mib"] * 2, 0.1), 2)
+                }
+        with open(args.thresholds, "w") as f:
+            json.dump(dict(sorted(thresholds.items())), f, indent=2)
+            f.write("\n")
+
+    regressed = [r for r in results if r["regressions"]]
+    for r in regressed:
+        print(f"REGRESSION {case_id(r['function'], r['shape'], r['rows'])}: {', '.join(r['regressions'])}",
+              file=sys.stderr)
+    return 1 if args.check and regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+import random
+import time
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Shared by the s3-kb and schema-extractor Lambdas through the common layer.
+
+TERMINAL_STATES = {"SUCCEEDED", "FAILED", "CANCELLED"}
+
+# batch_get_query_execution accepts at most 50 IDs per call
+BATCH_GET_LIMIT = 50
+
+# Stay well under the account's active DML query quota by default
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("ATHENA_MAX_CONCURRENCY", "5"))
+
+# When Athena rejects a start while none of our queries is running, other
+# workloads hold the account's slots: back off exponentially (with jitter) and
+# give up after this many consecutive rejections instead of spinning until
+# the Lambda times out
+DEFAULT_MAX_START_ATTEMPTS = int(os.environ.get("ATHENA_MAX_START_ATTEMPTS", "8"))
+THROTTLE_BACKOFF_SECONDS = 1.0
+MAX_THROTTLE_BACKOFF_SECONDS = 30.0
+
+AthenaQueryResult = namedtuple("AthenaQueryResult", ["key", "query_execution_id", "state", "reason"])
+
+
+class AthenaQueryEngine:
+    """Runs many Athena queries concurrently with a bounded number in flight."""
+
+    def __init__(self,
+                 output_location: str,
+                 athena_client=None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 poll_interval: float = 1.0,
+                 max_poll_interval: float = 5.0,
+                 max_start_attempts: int = DEFAULT_MAX_START_ATTEMPTS):
+        """
+        Initialize the engine.
+
+        Args:
+            output_location: S3 location for Athena query results
+            athena_client: Pre-configured boto3 athena client
+            max_concurrency: Maximum number of queries running at once
+            poll_interval: Initial seconds between batched status checks
+            max_poll_interval: Upper bound for the poll interval, which backs
+                off while nothing finishes
+            max_start_attempts: Consecutive TooManyRequestsException rejections,
+                with none of our queries running, before a query is failed
+        """
+        self.__client = athena_client or get_client("athena", max_pool_connections=max_concurrency)
+        self.__output_location = output_location
+        self.__max_concurrency = max(1, max_concurrency)
+        self.__poll_interval = poll_interval
+        self.__max_poll_interval = max_poll_interval
+        self.__max_start_attempts = max(1, max_start_attempts)
+
+    def run_queries(self, queries: Iterable[Tuple[str, str, str]]) -> Iterator[AthenaQueryResult]:
+        """
+        Submit queries up to the concurrency limit and yield each as it finishes.
+
+        Args:
+            queries: Iterable of (key, database, query_string); key is any
+                caller-side identifier returned with the result
+
+        Yields:
+            AthenaQueryResult in completion order. A query Athena keeps
+            rejecting (see max_start_attempts) is yielded as FAILED with no
+            query_execution_id and the rejection as reason.
+        """
+        pending = iter(queries)
+        backlog = []  # queries rejected with TooManyRequestsException
+        running = {}  # query_execution_id -> key
+        exhausted = False
+        interval = self.__poll_interval
+        throttled = 0  # consecutive rejections while none of ours was running
+        throttle_delay = 0.0
+
+        while True:
+            # Top up to the concurrency limit
+            while len(running) < self.__max_concurrency:
+                if backlog:
+                    query = backlog.pop(0)
+                elif not exhausted:
+                    query = next(pending, None)
+                    if query is None:
+                        exhausted = True
+                        continue
+                else:
+                    break
+                key, database, query_string = query
+                try:
+                    running[self.__start(database, query_string)] = key
+                    throttled = 0
+                except ClientError as e:
+                    if e.response.get("Error", {}).get("Code") != "TooManyRequestsException":
+                        raise
+                    if running:
+                        # Our own queries hold the slots; retry once one finishes
+                        backlog.insert(0, query)
+                        break
+                    throttled += 1
+                    if throttled >= self.__max_start_attempts:
+                        yield AthenaQueryResult(
+                            key=key,
+                            query_execution_id=None,
+                            state="FAILED",
+                            reason=f"Not started: {throttled} consecutive start attempts were rejected with "
+                                   f"TooManyRequestsException while none of this run's queries were active; "
+                                   f"the account's active query limit is held by other workloads"
+                        )
+                        continue
+                    backlog.insert(0, query)
+                    throttle_delay = min(THROTTLE_BACKOFF_SECONDS * 2 ** (throttled - 1), MAX_THROTTLE_BACKOFF_SECONDS)
+                    break
+
+            if not running:
+                if backlog:
+                    time.sleep(throttle_delay * (0.5 + random.random() / 2))
+                    continue
+                return
+
+            time.sleep(interval)
+            finished = []
+            ids = list(running)
+            for i in range(0, len(ids), BATCH_GET_LIMIT):
+                response = self.__client.batch_get_query_execution(QueryExecutionIds=ids[i:i + BATCH_GET_LIMIT])
+                for execution in response.get("QueryExecutions", []):
+                    status = execution["Status"]
+                    if status["State"] in TERMINAL_STATES:
+                        finished.append(AthenaQueryResult(
+                            key=running.pop(execution["QueryExecutionId"]),
+                            query_execution_id=execution["QueryExecutionId"],
+                            state=status["State"],
+                            reason=status.get("StateChangeReason")
+                        ))
+
+            # Poll faster while results are coming in, back off while idle
+            interval = self.__poll_interval if finished else min(interval * 1.5, self.__max_poll_interval)
+            for result in finished:
+                yield result
+
+    def run(self, database: str, query_string: str) -> str:
+        """Run a single query, wait for it and return its execution ID."""
+        for result in self.run_queries([(None, database, query_string)]):
+            if result.state != "SUCCEEDED":
+                raise Exception(f"Athena query failed: {result.state} {result.reason or ''}".rstrip())
+            return result.query_execution_id
+
+    def get_results(self, query_execution_id: str, default: Optional[str] = "NULL") -> List[List[Optional[str]]]:
+        """Fetch every page of a query's results without the header row."""
+        rows = []
+        paginator = self.__client.get_paginator("get_query_results")
+        for page in paginator.paginate(QueryExecutionId=query_execution_id):
+            for row in page["ResultSet"]["Rows"]:
+                rows.append([col.get("VarCharValue", default) for col in row["Data"]])
+        return rows[1:]  # Skip header row (only present on the first page)
+
+    def __start(self, database: str, query_string: str) -> str:
+        """Start one query and return its execution ID."""
+        response = self.__client.start_query_execution(
+            QueryString=query_string,
+            QueryExecutionContext={"Database": database},
+            ResultConfiguration={"OutputLocation": self.__output_location}
+        )
+        return response["QueryExecutionId"]
@@ -0,0 +1,103 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+from typing import Any, Dict, Optional
+
+# Shared by the freight_audit, s3-kb, schema-extractor and concept-embedder
+# Lambdas through the common layer. Clients are created once per container
+# and reused across invocations and threads (boto3 clients are thread-safe;
+# creating them is not, so creation is serialized here).
+
+# Connections kept per client; raise it to at least the number of threads
+# that share a client (e.g. EMBED_CONCURRENCY)
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "10"))
+
+# "adaptive" adds client-side rate limiting on top of standard retries, so
+# throttled workers slow down together instead of retrying in lockstep
+RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "adaptive")
+# Retries after the first attempt (botocore counts max_attempts this way)
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "5"))
+
+# (connect_timeout, read_timeout) seconds per service. Model invocations can
+# take minutes; control-plane calls and log shipping should fail fast.
+SERVICE_TIMEOUTS = {
+    "bedrock-runtime": (5, 300),
+    "bedrock-agent-runtime": (5, 60),
+    "athena": (5, 30),
+    "glue": (5, 30),
+    "s3": (5, 60),
+    "firehose": (2, 5),
+}
+DEFAULT_TIMEOUTS = (5, 60)
+
+_clients: Dict[tuple, Any] = {}
+_session: Optional[boto3.session.Session] = None
+_lock = threading.Lock()
+
+
+def client_config(service_name: str,
+                  max_pool_connections: Optional[int] = None,
+                  **overrides) -> Config:
+    """
+    Build the botocore Config used for a service.
+
+    Args:
+        service_name: boto3 service name, e.g. "bedrock-runtime"
+        max_pool_connections: HTTP connections kept open for the client
+        **overrides: Any other Config arguments, e.g. read_timeout=900
+
+    Returns:
+        Config with pooled keep-alive connections, retries and timeouts
+    """
+    connect_timeout, read_timeout = SERVICE_TIMEOUTS.get(service_name, DEFAULT_TIMEOUTS)
+    settings = {
+        "max_pool_connections": max_pool_connections or DEFAULT_MAX_POOL_CONNECTIONS,
+        "tcp_keepalive": True,
+        "retries": {"mode": RETRY_MODE, "max_attempts": MAX_ATTEMPTS},
+        "connect_timeout": connect_timeout,
+        "read_timeout": read_timeout,
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_client(service_name: str,
+               region_name: Optional[str] = None,
+               max_pool_connections: Optional[int] = None,
+               endpoint_url: Optional[str] = None,
+               **config_overrides):
+    """
+    Return the shared boto3 client for a service, creating it on first use.
+
+    Args:
+        service_name: boto3 service name
+        region_name: Region; defaults to the Lambda's AWS_REGION
+        max_pool_connections: HTTP connections kept open; match the number
+            of threads using the client
+        endpoint_url: Alternative endpoint, e.g. a local stand-in for tests
+        **config_overrides: Extra botocore Config arguments
+
+    Returns:
+        The same client for the same (service, region, endpoint, config)
+    """
+    key = (service_name, region_name, endpoint_url, max_pool_connections or DEFAULT_MAX_POOL_CONNECTIONS,
+           tuple(sorted((name, repr(value)) for name, value in config_overrides.items())))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(
+                service_name,
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=client_config(service_name, max_pool_connections, **config_overrides)
+            )
+            _clients[key] = client
+    return client
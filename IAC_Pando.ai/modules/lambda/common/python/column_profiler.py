@@ -0,0 +1,201 @@
+import os
+from athena_engine import AthenaQueryEngine
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Shared by the s3-kb and schema-extractor Lambdas through the common layer.
+#
+# Profiles are returned as
+#   {table_name: {column_name: {"approx_distinct", "null_rate", "min", "max", "top_values"}}}
+# where every key except "null_rate" may be missing when it does not apply to
+# the column type. "top_values" is [[value, count], ...] in descending count.
+
+# Profiling scans table data; it only runs when explicitly enabled
+PROFILE_COLUMNS = os.environ.get("PROFILE_COLUMNS", "false").lower() == "true"
+
+# Optional TABLESAMPLE BERNOULLI percentage to cap the bytes scanned per table
+PROFILE_SAMPLE_PERCENT = float(os.environ.get("PROFILE_SAMPLE_PERCENT", "0")) or None
+
+# Columns per aggregate query; keeps the SELECT list of wide tables manageable
+COLUMNS_PER_QUERY = 50
+
+# Only columns with at most this many distinct values get a top-K list
+LOW_CARDINALITY_LIMIT = 50
+TOP_K = 10
+MAX_VALUE_LENGTH = 100
+
+# Athena (Trino) and Glue (Hive) spellings of types that cannot be profiled
+# beyond their null rate, and of types where min/max is meaningful
+COMPLEX_TYPE_PREFIXES = ("array", "map", "struct", "row", "binary", "varbinary", "json")
+ORDERED_TYPE_PREFIXES = ("tinyint", "smallint", "int", "bigint", "float", "real", "double", "decimal",
+                         "date", "timestamp")
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a table or column name for Athena."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_complex_type(data_type: str) -> bool:
+    return (data_type or "").lower().startswith(COMPLEX_TYPE_PREFIXES)
+
+
+def is_ordered_type(data_type: str) -> bool:
+    return (data_type or "").lower().startswith(ORDERED_TYPE_PREFIXES)
+
+
+def describe_profile(profile: Optional[Dict[str, Any]]) -> str:
+    """
+    Render a column profile as a short "| ..." suffix for schema documents.
+
+    Args:
+        profile: Column profile as returned by ColumnProfiler.profile
+
+    Returns:
+        e.g. " | Distinct: ~4 | Nulls: 0.0% | Values: 'air', 'ocean'", or "" without a profile
+    """
+    if not profile:
+        return ""
+    parts = []
+    if profile.get("approx_distinct") is not None:
+        parts.append(f"Distinct: ~{profile['approx_distinct']}")
+    if profile.get("null_rate") is not None:
+        parts.append(f"Nulls: {profile['null_rate']:.1%}")
+    if profile.get("min") is not None or profile.get("max") is not None:
+        parts.append(f"Range: {profile.get('min')} .. {profile.get('max')}")
+    if profile.get("top_values"):
+        parts.append("Values: " + ", ".join(f"'{value}'" for value, _ in profile["top_values"]))
+    return "".join(f" | {part}" for part in parts)
+
+
+class ColumnProfiler:
+    """Computes per-column value profiles with batched, concurrent Athena queries."""
+
+    def __init__(self,
+                 engine: AthenaQueryEngine,
+                 top_k: int = TOP_K,
+                 low_cardinality_limit: int = LOW_CARDINALITY_LIMIT,
+                 sample_percent: Optional[float] = PROFILE_SAMPLE_PERCENT):
+        """
+        Initialize the profiler.
+
+        Args:
+            engine: Shared AthenaQueryEngine
+            top_k: Number of most frequent values kept per low-cardinality column
+            low_cardinality_limit: Maximum approx_distinct for a top-K list
+            sample_percent: Optional TABLESAMPLE BERNOULLI percentage (0-100)
+        """
+        self.__engine = engine
+        self.__top_k = top_k
+        self.__low_cardinality_limit = low_cardinality_limit
+        self.__sample_percent = sample_percent
+
+    def profile(self, database_name: str, tables: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Profile every column of the given tables.
+
+        Pass 1 runs one aggregate query per table (per COLUMNS_PER_QUERY
+        columns) for approx_distinct, null counts and min/max. Pass 2 runs one
+        UNION ALL query per table for the top-K values of its low-cardinality
+        columns. Both passes run through the engine's concurrency limit.
+        Tables whose queries fail are logged and left unprofiled.
+
+        Args:
+            database_name: Athena database
+            tables: {table_name: [{"name", "type"}, ...]}
+
+        Returns:
+            {table_name: {column_name: profile}}
+        """
+        profiles = {table_name: {} for table_name in tables}
+
+        for (table_name, columns), row in self.__run(database_name, self.__aggregate_queries(tables)):
+            row_count = int(row[0] or 0)
+            values = iter(row[1:])
+            for column in columns:
+                profile = {}
+                if not is_complex_type(column["type"]):
+                    distinct = next(values)
+                    profile["approx_distinct"] = int(distinct) if distinct is not None else 0
+                nulls = int(next(values) or 0)
+                profile["null_rate"] = round(nulls / row_count, 4) if row_count else 0.0
+                if is_ordered_type(column["type"]):
+                    profile["min"], profile["max"] = next(values), next(values)
+                profiles[table_name][column["name"]] = profile
+
+        low_cardinality = {
+            table_name: [
+                column for column in columns
+                if 0 < profiles[table_name].get(column["name"], {}).get("approx_distinct", 0) <= self.__low_cardinality_limit
+            ]
+            for table_name, columns in tables.items()
+        }
+        for table_name, rows in self.__run_grouped(database_name, self.__top_value_queries(low_cardinality)):
+            for column_name, value, count in rows:
+                profile = profiles[table_name][column_name]
+                if value is not None:
+                    profile.setdefault("top_values", []).append([value[:MAX_VALUE_LENGTH], int(count)])
+
+        return profiles
+
+    def annotate(self, database_name: str, tables: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Profile tables in the schema_catalog structure in place, setting a
+        "profile" on every column ({} when its query failed).
+
+        Args:
+            database_name: Athena database
+            tables: {table_name: {"description", "columns": [...]}}
+        """
+        profiles = self.profile(database_name, {name: table["columns"] for name, table in tables.items()})
+        for table_name, table in tables.items():
+            for column in table["columns"]:
+                column["profile"] = profiles.get(table_name, {}).get(column["name"], {})
+
+    def __source(self, table_name: str) -> str:
+        source = quote_identifier(table_name)
+        if self.__sample_percent:
+            source += f" TABLESAMPLE BERNOULLI ({self.__sample_percent})"
+        return source
+
+    def __aggregate_queries(self, tables: Dict[str, List[Dict[str, Any]]]) -> Iterator[Tuple[Any, str]]:
+        """Yield ((table_name, columns), sql) aggregate queries."""
+        for table_name, columns in tables.items():
+            for i in range(0, len(columns), COLUMNS_PER_QUERY):
+                batch = columns[i:i + COLUMNS_PER_QUERY]
+                select = ["count(*)"]
+                for column in batch:
+                    name = quote_identifier(column["name"])
+                    if not is_complex_type(column["type"]):
+                        select.append(f"approx_distinct({name})")
+                    select.append(f"count_if({name} IS NULL)")
+                    if is_ordered_type(column["type"]):
+                        select += [f"CAST(min({name}) AS varchar)", f"CAST(max({name}) AS varchar)"]
+                yield (table_name, batch), f"SELECT {', '.join(select)} FROM {self.__source(table_name)}"
+
+    def __top_value_queries(self, tables: Dict[str, List[Dict[str, Any]]]) -> Iterator[Tuple[str, str]]:
+        """Yield (table_name, sql) top-K queries, one per table with low-cardinality columns."""
+        for table_name, columns in tables.items():
+            if not columns:
+                continue
+            subqueries = [
+                f"SELECT * FROM (SELECT '{column['name'].replace(chr(39), chr(39) * 2)}' AS column_name, "
+                f"CAST({quote_identifier(column['name'])} AS varchar) AS value, count(*) AS cnt "
+                f"FROM {self.__source(table_name)} GROUP BY 2 ORDER BY 3 DESC LIMIT {self.__top_k})"
+                for column in columns
+            ]
+            yield table_name, "\nUNION ALL\n".join(subqueries)
+
+    def __run(self, database_name: str, queries: Iterator[Tuple[Any, str]]) -> Iterator[Tuple[Any, List[Optional[str]]]]:
+        """Run single-row queries, yielding (key, row) for each that succeeds."""
+        for key, rows in self.__run_grouped(database_name, queries):
+            if rows:
+                yield key, rows[0]
+
+    def __run_grouped(self, database_name: str, queries: Iterator[Tuple[Any, str]]) -> Iterator[Tuple[Any, List[List[Optional[str]]]]]:
+        """Run queries concurrently, yielding (key, rows) for each that succeeds."""
+        for result in self.__engine.run_queries((key, database_name, sql) for key, sql in queries):
+            if result.state != "SUCCEEDED":
+                table_name = result.key[0] if isinstance(result.key, tuple) else result.key
+                print(f"Profiling query for {table_name} failed: {result.state} {result.reason}")
+                continue
+            yield result.key, self.__engine.get_results(result.query_execution_id, default=None)
@@ -0,0 +1,256 @@
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Shared through the common layer. Titan embeddings behind an in-process LRU
+# cache and an optional persistent store, keyed by
+#   sha256("<model id>|<dimensions>|<normalized text>")
+# so a repeated or re-phrased-with-whitespace question is embedded once per
+# container (or once ever, with a store). Texts are embedded in normalized
+# form, which keeps a cached vector identical to a freshly computed one.
+#
+# A store adds one read (an S3 GET, typically 10-50 ms in-region) to every
+# memory miss before the model is called; writes run on a background thread
+# and add no latency. In Lambda a write still pending when the handler
+# returns completes on the next invocation or is lost with the container,
+# which only costs a later cache miss.
+
+DEFAULT_MODEL_ID = "amazon.titan-embed-text-v2:0"
+DEFAULT_DIMENSIONS = 1024
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_MAX_WORKERS = 4
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalizes text and collapses runs of whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embedding_key(text: str, model_id: str = DEFAULT_MODEL_ID, dimensions: int = DEFAULT_DIMENSIONS) -> str:
+    """Cache key for a text under a model and output size."""
+    return hashlib.sha256(f"{model_id}|{dimensions}|{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore(ABC):
+    """Abstract base class for persistent embedding caches."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[List[float]]:
+        """Return the stored vector for a key, or None."""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, vector: List[float]) -> None:
+        """Store a vector under a key."""
+        pass
+
+
+class S3EmbeddingStore(EmbeddingStore):
+    """Stores each vector as raw little-endian float32 bytes at <prefix><key[:2]>/<key>."""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = "embedding-cache/"):
+        """
+        Initialize the store.
+
+        Args:
+            s3_client: boto3 s3 client
+            bucket: Bucket holding the cache
+            prefix: Key prefix; the first two hash characters spread keys over sub-prefixes
+        """
+        self.__client = s3_client
+        self.__bucket = bucket
+        self.__prefix = prefix
+
+    def __object_key(self, key: str) -> str:
+        return f"{self.__prefix}{key[:2]}/{key}"
+
+    def get(self, key: str) -> Optional[List[float]]:
+        try:
+            body = self.__client.get_object(Bucket=self.__bucket, Key=self.__object_key(key))["Body"].read()
+        except self.__client.exceptions.NoSuchKey:
+            return None
+        return array("f", body).tolist()
+
+    def put(self, key: str, vector: List[float]) -> None:
+        self.__client.put_object(
+            Bucket=self.__bucket,
+            Key=self.__object_key(key),
+            Body=array("f", vector).tobytes(),
+            ContentType="application/octet-stream"
+        )
+
+
+class EmbeddingService:
+    """Titan embeddings with an LRU cache, an optional persistent store and in-flight de-duplication."""
+
+    def __init__(self,
+                 bedrock_client,
+                 model_id: str = DEFAULT_MODEL_ID,
+                 dimensions: int = DEFAULT_DIMENSIONS,
+                 cache_size: int = DEFAULT_CACHE_SIZE,
+                 store: Optional[EmbeddingStore] = None,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        """
+        Initialize the service.
+
+        Args:
+            bedrock_client: boto3 bedrock-runtime client; its connection pool
+                should hold at least max_workers connections
+            model_id: Titan embedding model
+            dimensions: Output vector size
+            cache_size: Vectors kept in memory (least recently used are dropped)
+            store: Optional persistent cache consulted after memory and
+                filled in the background after every model call
+            max_workers: Concurrent model calls in embed_many
+        """
+        self.__client = bedrock_client
+        self.__model_id = model_id
+        self.__dimensions = dimensions
+        self.__cache_size = cache_size
+        self.__store = store
+        self.__max_workers = max(1, max_workers)
+        self.__cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.__in_flight: Dict[str, Future] = {}
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__writer: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def embed(self, text: str) -> List[float]:
+        """Return the embedding of one text."""
+        return self.embed_many([text])[0]
+
+    def embed_many(self, texts: Iterable[str]) -> List[List[float]]:
+        """
+        Return embeddings for many texts, in order.
+
+        Duplicate texts, texts already cached and texts another thread is
+        embedding right now are each resolved without a new model call; the
+        remaining ones are embedded concurrently (up to max_workers).
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            One vector per input text
+        """
+        texts = list(texts)
+        keys = [embedding_key(text, self.__model_id, self.__dimensions) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        waiting: Dict[str, Future] = {}
+        owned: Dict[str, Future] = {}
+
+        with self.__lock:
+            for key, text in zip(keys, texts):
+                if key in vectors or key in waiting or key in owned:
+                    continue
+                if key in self.__cache:
+                    self.__cache.move_to_end(key)
+                    vectors[key] = self.__cache[key]
+                    self.hits += 1
+                elif key in self.__in_flight:
+                    waiting[key] = self.__in_flight[key]
+                    self.hits += 1
+                else:
+                    owned[key] = self.__in_flight[key] = Future()
+
+        if owned:
+            first_text = dict(zip(keys, texts))
+            computed = self.__compute({key: first_text[key] for key in owned})
+            for key, future in owned.items():
+                if isinstance(computed[key], BaseException):
+                    future.set_exception(computed[key])
+                else:
+                    future.set_result(computed[key])
+
+        for key, future in list(owned.items()) + list(waiting.items()):
+            vectors[key] = future.result()
+        return [vectors[key] for key in keys]
+
+    def __compute(self, texts: Dict[str, str]) -> Dict[str, object]:
+        """Resolve owned keys from the store or the model; values are vectors or the raised exception."""
+        def resolve(key: str) -> List[float]:
+            vector = self.__load(key)
+            if vector is None:
+                vector = self.__invoke(normalize_text(texts[key]))
+                with self.__lock:
+                    self.misses += 1
+                self.__save(key, vector)
+            else:
+                with self.__lock:
+                    self.store_hits += 1
+            return vector
+
+        def settle(key: str):
+            try:
+                result = resolve(key)
+            except Exception as e:
+                result = e
+            with self.__lock:
+                self.__in_flight.pop(key, None)
+                if not isinstance(result, BaseException):
+                    self.__remember(key, result)
+            return result
+
+        keys = list(texts)
+        if len(keys) == 1:
+            return {keys[0]: settle(keys[0])}
+        return dict(zip(keys, self.__pool().map(settle, keys)))
+
+    def __pool(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.__max_workers)
+            return self.__executor
+
+    def __remember(self, key: str, vector: List[float]) -> None:
+        """Add to the LRU cache; callers hold the lock."""
+        self.__cache[key] = vector
+        self.__cache.move_to_end(key)
+        while len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+
+    def __load(self, key: str) -> Optional[List[float]]:
+        if self.__store is None:
+            return None
+        try:
+            return self.__store.get(key)
+        except Exception as e:
+            logger.warning(f"Embedding store read failed, calling the model: {str(e)}")
+            return None
+
+    def __save(self, key: str, vector: List[float]) -> None:
+        """Queue a store write; the caller does not wait for it."""
+        if self.__store is None:
+            return
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = ThreadPoolExecutor(max_workers=1)
+            writer = self.__writer
+        writer.submit(self.__put, key, vector)
+
+    def __put(self, key: str, vector: List[float]) -> None:
+        try:
+            self.__store.put(key, vector)
+        except Exception as e:
+            logger.warning(f"Embedding store write failed: {str(e)}")
+
+    def __invoke(self, text: str) -> List[float]:
+        response = self.__client.invoke_model(
+            modelId=self.__model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps({"inputText": text, "dimensions": self.__dimensions, "normalize": True})
+        )
+        return json.loads(response["body"].read())["embedding"]
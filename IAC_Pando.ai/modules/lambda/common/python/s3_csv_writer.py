@@ -0,0 +1,111 @@
+import csv
+import gzip
+import io
+from typing import Any, Dict, Iterable, List
+
+# Shared through the common layer. Streams CSV rows through gzip straight into
+# an S3 multipart upload, so only one part is ever held in memory.
+
+# S3 requires every part but the last to be at least 5 MiB
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """Writable binary stream that uploads to S3 in multipart chunks."""
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = DEFAULT_PART_SIZE, **create_kwargs):
+        """
+        Start a multipart upload.
+
+        Args:
+            s3_client: boto3 s3 client
+            bucket: Target bucket
+            key: Target object key
+            part_size: Bytes buffered before a part is uploaded (>= 5 MiB)
+            **create_kwargs: Extra create_multipart_upload arguments, e.g. ContentType
+        """
+        super().__init__()
+        self.__client = s3_client
+        self.__bucket = bucket
+        self.__key = key
+        self.__part_size = part_size
+        self.__buffer = bytearray()
+        self.__parts = []
+        self.__upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **create_kwargs)["UploadId"]
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        """Buffer bytes and upload a part whenever the buffer is full."""
+        self.__buffer.extend(data)
+        while len(self.__buffer) >= self.__part_size:
+            self.__upload_part(bytes(self.__buffer[:self.__part_size]))
+            del self.__buffer[:self.__part_size]
+        return len(data)
+
+    def complete(self):
+        """Upload the remaining bytes and complete the upload."""
+        if self.__buffer or not self.__parts:
+            self.__upload_part(bytes(self.__buffer))
+            self.__buffer.clear()
+        self.__client.complete_multipart_upload(
+            Bucket=self.__bucket,
+            Key=self.__key,
+            UploadId=self.__upload_id,
+            MultipartUpload={"Parts": self.__parts}
+        )
+
+    def abort(self):
+        """Abort the upload so no orphaned parts are left behind."""
+        self.__client.abort_multipart_upload(Bucket=self.__bucket, Key=self.__key, UploadId=self.__upload_id)
+
+    def __upload_part(self, body: bytes):
+        part_number = len(self.__parts) + 1
+        response = self.__client.upload_part(
+            Bucket=self.__bucket,
+            Key=self.__key,
+            UploadId=self.__upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self.__parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+
+class GzipCsvWriter:
+    """
+    Context manager writing dict rows as gzip-compressed CSV to S3.
+
+    Usage:
+        with GzipCsvWriter(s3_client, bucket, "nodes.csv.gz", fieldnames) as writer:
+            writer.writerows(rows)
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, fieldnames: List[str], part_size: int = DEFAULT_PART_SIZE):
+        self.__upload = S3MultipartWriter(s3_client, bucket, key, part_size, ContentType="application/gzip")
+        self.__gzip = gzip.GzipFile(fileobj=self.__upload, mode="wb")
+        self.__text = io.TextIOWrapper(self.__gzip, encoding="utf-8", newline="")
+        self.__writer = csv.DictWriter(self.__text, fieldnames=fieldnames, restval="", lineterminator="\n")
+        self.__writer.writeheader()
+        self.rows_written = 0
+
+    def writerow(self, row: Dict[str, Any]):
+        self.__writer.writerow(row)
+        self.rows_written += 1
+
+    def writerows(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self.writerow(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.__upload.abort()
+            return False
+        # Closing the text wrapper flushes and closes the gzip stream, which
+        # writes the gzip trailer into the upload buffer
+        self.__text.close()
+        self.__upload.complete()
+        return False
@@ -0,0 +1,118 @@
+import os
+from athena_engine import AthenaQueryEngine
+from aws_clients import get_client
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+# Shared by the s3-kb and schema-extractor Lambdas through the common layer.
+#
+# Both backends return the same structure:
+#   {table_name: {"description": str | None,
+#                 "columns": [{"name", "type", "comment", "partition_key"}, ...]}}
+# with columns in table order and partition keys last.
+
+
+class SchemaBackend(ABC):
+    """Abstract base class for table metadata sources."""
+
+    @abstractmethod
+    def list_tables(self, database_name: str) -> Dict[str, Dict[str, Any]]:
+        """Return every table of a database with its columns."""
+        pass
+
+
+class GlueSchemaBackend(SchemaBackend):
+    """Reads table metadata from the Glue Data Catalog with paginated get_tables calls."""
+
+    def __init__(self, glue_client=None, catalog_id: Optional[str] = None):
+        """
+        Initialize the Glue backend.
+
+        Args:
+            glue_client: Pre-configured boto3 glue client. Defaults to one that
+                honours GLUE_ENDPOINT_URL, so tests can point at a local Glue
+                stand-in (e.g. moto_server or LocalStack).
+            catalog_id: Optional Data Catalog (account) ID
+        """
+        self.__client = glue_client or get_client("glue", endpoint_url=os.environ.get("GLUE_ENDPOINT_URL") or None)
+        self.__catalog_id = catalog_id
+
+    def list_tables(self, database_name: str) -> Dict[str, Dict[str, Any]]:
+        """Return every table of a database with its columns and partition keys."""
+        params = {"DatabaseName": database_name}
+        if self.__catalog_id:
+            params["CatalogId"] = self.__catalog_id
+
+        tables = {}
+        paginator = self.__client.get_paginator("get_tables")
+        for page in paginator.paginate(**params):
+            for table in page.get("TableList", []):
+                columns = [
+                    self.__column(col, partition_key=False)
+                    for col in table.get("StorageDescriptor", {}).get("Columns", [])
+                ]
+                columns += [self.__column(col, partition_key=True) for col in table.get("PartitionKeys", [])]
+                tables[table["Name"]] = {"description": table.get("Description"), "columns": columns}
+        return tables
+
+    @staticmethod
+    def __column(col: Dict[str, Any], partition_key: bool) -> Dict[str, Any]:
+        """Convert a Glue column definition to the shared column structure."""
+        return {
+            "name": col["Name"],
+            "type": col.get("Type", ""),
+            "comment": col.get("Comment"),
+            "partition_key": partition_key
+        }
+
+
+class AthenaSchemaBackend(SchemaBackend):
+    """Reads table metadata with a single Athena information_schema.columns query."""
+
+    def __init__(self, output_location: str, athena_client=None, engine: Optional[AthenaQueryEngine] = None):
+        """
+        Initialize the Athena backend.
+
+        Args:
+            output_location: S3 location for Athena query results
+            athena_client: Pre-configured boto3 athena client
+            engine: Optional shared AthenaQueryEngine; created if not given
+        """
+        self.__engine = engine or AthenaQueryEngine(output_location, athena_client=athena_client)
+
+    def list_tables(self, database_name: str) -> Dict[str, Dict[str, Any]]:
+        """Return every table of a database with its columns and partition keys."""
+        query = f"""
+            SELECT table_name, column_name, data_type, comment, extra_info
+            FROM information_schema.columns
+            WHERE table_schema = '{database_name}'
+            ORDER BY table_name, ordinal_position;
+        """
+        query_execution_id = self.__engine.run(database_name, query)
+        tables = {}
+        for table_name, col_name, col_type, comment, extra_info in self.__engine.get_results(query_execution_id, default=None):
+            table = tables.setdefault(table_name, {"description": None, "columns": []})
+            table["columns"].append({
+                "name": col_name,
+                "type": col_type,
+                "comment": comment,
+                "partition_key": extra_info == "partition key"
+            })
+        return tables
+
+
+def get_schema_backend(name: str, **kwargs) -> SchemaBackend:
+    """
+    Create a schema backend by name.
+
+    Args:
+        name: 'glue' or 'athena'
+        **kwargs: Passed to the backend constructor
+
+    Returns:
+        SchemaBackend instance
+    """
+    backends = {"glue": GlueSchemaBackend, "athena": AthenaSchemaBackend}
+    if name not in backends:
+        raise ValueError(f"Invalid schema backend '{name}'. Valid values: {', '.join(backends)}")
+    return backends[name](**kwargs)
@@ -0,0 +1,147 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import math
+import os
+from array import array
+from s3_csv_writer import GzipCsvWriter  # common layer
+from aws_clients import get_client  # common layer
+from embedding_service import EmbeddingService, embedding_key  # common layer
+
+# S3 Configuration (same bucket/prefix as schema-extractor)
+S3_BUCKET = os.environ.get("S3_BUCKET", "athena-neptune-data")
+S3_TARGET_PATH = os.environ.get("S3_TARGET_PATH", "neptune-nodes-data/")
+
+# Input: the Concept vertex file (:ID, query:string, :LABEL, ...; optionally
+# .gz). No job in this repository produces it: Concepts are curated by hand
+# and the file is uploaded together with their Concept -> Table/Column edges,
+# which is why it sits with the schema-extractor output.
+CONCEPTS_KEY = f"{S3_TARGET_PATH}concepts.csv"
+# Output: the same vertices with embedding:string, under a prefix of its own.
+# Bulk load it after S3_TARGET_PATH (updateSingleCardinalityProperties) so
+# the embeddings are added to the Concepts already loaded from concepts.csv
+# instead of the prefix load reading every Concept twice.
+CONCEPT_LOAD_PATH = os.environ.get("CONCEPT_LOAD_PATH", "neptune-concept-data/")
+OUTPUT_KEY = f"{CONCEPT_LOAD_PATH}concepts_embedded.csv.gz"
+# Working file, kept out of every load prefix: embedding_key -> encoded vector
+ARTIFACT_BUCKET = os.environ.get("ARTIFACT_BUCKET", "pando-db-auto-schema-artifacts")
+CACHE_KEY = "concept-embedder/cache.json.gz"
+# Where earlier versions kept the output and cache, inside S3_TARGET_PATH;
+# removed on the next run
+LEGACY_OUTPUT_KEY = f"{S3_TARGET_PATH}concepts_embedded.csv.gz"
+LEGACY_CACHE_KEY = f"{S3_TARGET_PATH}concept-embeddings/cache.json.gz"
+
+# Embedding settings
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1024"))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "8"))
+
+# AWS Clients; one pooled connection per embedding worker. Throttled calls
+# are retried by the client's adaptive retry mode, which also slows the
+# workers down together.
+s3_client = get_client("s3")
+bedrock_client = get_client("bedrock-runtime", max_pool_connections=EMBED_CONCURRENCY)
+
+# Same normalization and request as freight_audit's query embeddings, so
+# Concept and query vectors are comparable
+embedding_service = EmbeddingService(
+    bedrock_client, EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS, max_workers=EMBED_CONCURRENCY
+)
+
+# Encoded vectors are base64 little-endian float32, prefixed so readers can
+# tell them apart from the older "[0.1, 0.2, ...]" text form
+EMBEDDING_PREFIX = "f32:"
+
+
+def text_hash(text):
+    """Cache key for a Concept text: its embedding_key (normalized text, model and dimensions)."""
+    return embedding_key(text, EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS)
+
+
+def encode_embedding(vector):
+    """L2-normalizes a vector and encodes it as prefixed base64 float32."""
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return EMBEDDING_PREFIX + base64.b64encode(array("f", (v / norm for v in vector)).tobytes()).decode("ascii")
+
+
+def read_concepts():
+    """Reads Concept rows from the bulk-load CSV in S3."""
+    key = CONCEPTS_KEY
+    try:
+        body = s3_client.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read()
+    except s3_client.exceptions.NoSuchKey:
+        key = f"{CONCEPTS_KEY}.gz"
+        body = gzip.decompress(s3_client.get_object(Bucket=S3_BUCKET, Key=key)["Body"].read())
+    print(f"Reading concepts from s3://{S3_BUCKET}/{key}")
+    return list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+
+
+def load_cache():
+    """
+    Loads {text hash: encoded embedding} from the previous run. Falls back to
+    a cache left under S3_TARGET_PATH by earlier versions.
+    """
+    for bucket, key in ((ARTIFACT_BUCKET, CACHE_KEY), (S3_BUCKET, LEGACY_CACHE_KEY)):
+        try:
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        except s3_client.exceptions.NoSuchKey:
+            continue
+        return json.loads(gzip.decompress(body))
+    return {}
+
+
+def save_cache(cache):
+    s3_client.put_object(
+        Bucket=ARTIFACT_BUCKET,
+        Key=CACHE_KEY,
+        Body=gzip.compress(json.dumps(cache).encode("utf-8")),
+        ContentType="application/gzip"
+    )
+    # Keep the bulk load prefix free of working files and duplicate Concepts
+    for key in (LEGACY_CACHE_KEY, LEGACY_OUTPUT_KEY):
+        s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
+
+
+def embed_concepts(concepts, cache):
+    """
+    Returns {text hash: encoded embedding} for every Concept text, embedding
+    only texts missing from the cache, through embedding_service.
+    """
+    hashes = {text_hash(row["query:string"]): row["query:string"] for row in concepts}
+    missing = [(h, text) for h, text in hashes.items() if h not in cache]
+    print(f"{len(hashes)} distinct concept texts, {len(missing)} to embed")
+
+    embeddings = {h: cache[h] for h in hashes if h in cache}
+    vectors = embedding_service.embed_many(text for _, text in missing)
+    for (h, _), vector in zip(missing, vectors):
+        embeddings[h] = encode_embedding(vector)
+    return embeddings
+
+
+def lambda_handler(event, context):
+    """AWS Lambda entry point."""
+    concepts = read_concepts()
+    if not concepts:
+        return {"statusCode": 200, "message": "No concepts to embed"}
+
+    cache = load_cache()
+    embeddings = embed_concepts(concepts, cache)
+
+    fieldnames = list(concepts[0].keys())
+    fieldnames = [f for f in fieldnames if f != "embedding:string"] + ["embedding:string"]
+    with GzipCsvWriter(s3_client, S3_BUCKET, OUTPUT_KEY, fieldnames) as writer:
+        for row in concepts:
+            row["embedding:string"] = embeddings[text_hash(row["query:string"])]
+            writer.writerow(row)
+
+    # Only keep vectors of current texts
+    save_cache(embeddings)
+
+    return {
+        "statusCode": 200,
+        "message": f"Concept embeddings written to s3://{S3_BUCKET}/{OUTPUT_KEY}",
+        "embedded": len(embeddings) - len(cache.keys() & embeddings.keys()),
+        "reused": len(cache.keys() & embeddings.keys())
+    }
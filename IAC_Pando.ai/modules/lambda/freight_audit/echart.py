@@ -1,12 +1,48 @@
 import json
 import random
-import boto3
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
 from typing import List, Dict, Any, Tuple, Optional, Union
 
+# Chart types the formatters and the classifiers can produce
+CHART_TYPES = ["line", "bar", "pie", "trend", "categorical"]
+
+# Local classifications at or above this confidence skip the Bedrock call
+LOCAL_CONFIDENCE_THRESHOLD = 0.75
+
+# Time series with at least this many points are drawn as trend charts
+TREND_MIN_POINTS = 12
+
+# Pie charts are only considered for up to this many slices
+PIE_MAX_CATEGORIES = 10
+
+TIME_NAME_TOKENS = {"date", "time", "timestamp", "day", "week", "month", "year", "quarter", "period", "yr", "qtr"}
+PART_TO_WHOLE_TOKENS = {"percent", "percentage", "pct", "share", "ratio", "proportion", "fraction"}
+MONTH_NAMES = {
+    "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "january", "february", "march", "april", "june", "july", "august", "september",
+    "october", "november", "december"
+}
+# Chart recommendations from Claude are reused for result sets of the same shape
+CHART_CACHE_TTL_SECONDS = 3600
+CHART_CACHE_MAX_ENTRIES = 256
+CARDINALITY_BUCKETS = [1, 5, 10, 25, 100]
+
+# signature -> (expires_at, chart_info), oldest first
+_chart_cache = OrderedDict()
+
+DATE_PATTERN = re.compile(r"^\d{4}([-/.]\d{1,2}){1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?$|^\d{4}[-/ ]?(q[1-4]|w\d{1,2})$|^\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}$")
+
 def data_to_echart(data: List[Dict[str, Any]], 
                    use_ai: bool = False, 
                    bedrock_client=None,
-                   model_id: str = "anthropic.claude-3-7-sonnet-20250219-v1:0"
+                   model_id: str = "anthropic.claude-3-7-sonnet-20250219-v1:0",
+                   confidence_threshold: float = LOCAL_CONFIDENCE_THRESHOLD,
+                   chart_hint: Optional[Dict[str, Any]] = None,
+                   compact: bool = False
                    ) -> Dict[str, Any]:
     """
     Analyzes SQL/table data and converts it to ECharts format with a descriptive title.
@@ -16,7 +52,11 @@ def data_to_echart(data: List[Dict[str, Any]],
         use_ai: Whether to use Claude via Bedrock to determine chart type
         bedrock_client: Pre-configured boto3 bedrock-runtime client
         model_id: Claude model ID for Bedrock
-      # chart_hint: Optional user hint about desired chart type
+        confidence_threshold: Minimum local classifier confidence to skip Bedrock
+        chart_hint: Optional {"type", "sub_type", "title"} returned alongside the
+            SQL; used instead of a model call when it fits the result shape
+        compact: Reference the rows through ECharts dataset `encode` mappings
+            instead of inlining values (pair with to_echart_dataset)
         
     Returns:
         Dictionary containing ECharts configuration
@@ -24,23 +64,38 @@ def data_to_echart(data: List[Dict[str, Any]],
     if not data or not isinstance(data, list) or len(data) == 0:
         raise ValueError("Input must be a non-empty list of data dictionaries")
     
+    # Clean column names - strip whitespace. The rename is applied lazily
+    # through row views, so the caller's records are neither copied nor mutated.
+    data = normalize_headers(data)
+    
     # Take a sample of data if it's large
     sample_size = min(10, len(data))
     sample_data = random.sample(data, sample_size) if len(data) > sample_size else data
+    sample_data = [dict(row) for row in sample_data]
     
-    # Clean column names - strip whitespace
-    for row in data:
-        if isinstance(row, dict):
-            clean_row = {}
-            for k, v in row.items():
-                clean_row[k.strip() if isinstance(k, str) else k] = v
-            row.clear()
-            row.update(clean_row)
-    
-    # Determine chart type and get description
+    # Determine chart type and get description. The local classifier handles
+    # the common shapes; Claude is only asked when it is unsure.
     chart_info = {"type": "bar", "description": "", "sub_type": None}
-    if use_ai and bedrock_client:
-        chart_info = analyze_with_bedrock(sample_data, bedrock_client, model_id)
+    profile = profile_columns(data) if chart_hint or (use_ai and bedrock_client) else None
+    hint_info = chart_info_from_hint(chart_hint, data, profile) if chart_hint else None
+    if hint_info:
+        chart_info = hint_info
+    elif chart_hint:
+        # The hint does not fit the actual result shape - analyze locally
+        # rather than making another model round trip
+        chart_info = classify_chart(data, profile)
+    elif use_ai and bedrock_client:
+        local_info = classify_chart(data, profile)
+        if local_info["confidence"] >= confidence_threshold:
+            chart_info = local_info
+        else:
+            signature = shape_signature(profile)
+            chart_info = get_cached_chart_info(signature)
+            if chart_info is None:
+                chart_info = analyze_with_bedrock(sample_data, bedrock_client, model_id)
+                # An empty description means Bedrock failed and we got the fallback
+                if chart_info["description"]:
+                    cache_chart_info(signature, chart_info)
         print(chart_info)
     else:
         chart_info["type"] = "bar"  # Default fallback
@@ -48,12 +103,447 @@ def data_to_echart(data: List[Dict[str, Any]],
     # Format the chart based on the determined type
     chart_config = chart_formatters[chart_info["type"]](data, chart_info.get("sub_type"))
     
+    if compact:
+        chart_config = compact_chart_config(chart_config, data)
+    
     # Add title with description if available
     if chart_info["description"]:
         chart_config["title"] = {"text": chart_info["description"]}
     
     return chart_config
 
+class NormalizedRow(Mapping):
+    """Read-only view of a row that exposes its keys under normalized names."""
+    
+    __slots__ = ("_row", "_source_keys", "_keys")
+    
+    def __init__(self, row: Dict[str, Any], source_keys: Dict[str, Any], keys: List[str]):
+        self._row = row
+        self._source_keys = source_keys
+        self._keys = keys
+    
+    def __getitem__(self, key):
+        return self._row[self._source_keys.get(key, key)]
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def __len__(self):
+        return len(self._keys)
+
+class NormalizedRecords(Sequence):
+    """Sequence of NormalizedRow views over the original list of rows."""
+    
+    def __init__(self, rows: List[Dict[str, Any]], source_keys: Dict[str, Any], keys: List[str]):
+        self._rows = rows
+        self._source_keys = source_keys
+        self._keys = keys
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [NormalizedRow(row, self._source_keys, self._keys) for row in self._rows[index]]
+        return NormalizedRow(self._rows[index], self._source_keys, self._keys)
+    
+    def __len__(self):
+        return len(self._rows)
+
+def normalize_headers(data: List[Dict[str, Any]]) -> Sequence:
+    """
+    Strips whitespace from column names. The rename map is computed once from
+    the first row's header; rows are wrapped in views rather than rebuilt.
+    
+    Returns:
+        The input list unchanged if no names need cleaning, otherwise a
+        NormalizedRecords view over it
+    """
+    if not data or not isinstance(data[0], dict):
+        return data
+    keys = []
+    source_keys = {}
+    for key in data[0].keys():
+        clean_key = key.strip() if isinstance(key, str) else key
+        keys.append(clean_key)
+        if clean_key != key:
+            source_keys[clean_key] = key
+    if not source_keys:
+        return data
+    return NormalizedRecords(data, source_keys, keys)
+
+def axis_label(val: Any) -> str:
+    """Category / slice name as the inline formatters draw it."""
+    return str(val).strip()
+
+def series_value(val: Any) -> float:
+    """
+    Series value as the inline formatters draw it: Athena strings such as
+    "1,234.50" are parsed and None counts as 0. Raises ValueError or
+    TypeError for anything else (e.g. the "NULL" placeholder).
+    """
+    if isinstance(val, str):
+        return float(val.replace(',', ''))
+    return float(val) if val is not None else 0
+
+def dataset_cell(val: Any) -> Any:
+    """Cell of a column that is not plotted: stripped, with "NULL" as null."""
+    if isinstance(val, str):
+        val = val.strip()
+        return None if val == "NULL" else val
+    return val
+
+def to_echart_dataset(data: List[Dict[str, Any]], value_columns: List[str] = None,
+                      label_columns: List[str] = None) -> Dict[str, Any]:
+    """
+    Converts rows to ECharts' columnar `dataset` form, storing each column name
+    once instead of once per row. Plotted columns are cleaned exactly like the
+    inline series/xAxis data, so both response formats draw the same chart.
+    
+    Args:
+        data: List of data dictionaries
+        value_columns: Columns plotted as values; parsed to numbers (0 where
+            the inline chart would show 0)
+        label_columns: Columns used as x-axis categories or slice names
+        
+    Returns:
+        Dict with 'dimensions' and column-major 'source'
+    """
+    if not data:
+        return {"dimensions": [], "source": {}}
+    value_columns = set(value_columns or [])
+    label_columns = set(label_columns or [])
+    keys = list(data[0].keys())
+    
+    def cleaned(key, val):
+        if key in value_columns:
+            try:
+                return series_value(val)
+            except (ValueError, TypeError):
+                return 0
+        if key in label_columns:
+            return axis_label(val)
+        return dataset_cell(val)
+    
+    return {
+        "dimensions": [{"name": k, "type": "number" if k in value_columns else "ordinal"} for k in keys],
+        "source": {k: [cleaned(k, row.get(k)) for row in data] for k in keys}
+    }
+
+def encoded_value_columns(chart_config: Dict[str, Any]) -> List[str]:
+    """Returns the columns a compact chart config plots as values."""
+    return _encoded_columns(chart_config, ("y", "value"))
+
+def encoded_label_columns(chart_config: Dict[str, Any]) -> List[str]:
+    """Returns the columns a compact chart config uses as categories or slice names."""
+    return _encoded_columns(chart_config, ("x", "itemName"))
+
+def _encoded_columns(chart_config: Dict[str, Any], dimensions: Tuple[str, ...]) -> List[str]:
+    columns = []
+    for series in chart_config.get("series", []) if isinstance(chart_config, dict) else []:
+        encode = series.get("encode", {})
+        for column in (encode.get(dimension) for dimension in dimensions):
+            if column is not None and column not in columns:
+                columns.append(column)
+    return columns
+
+def compact_chart_config(chart_config: Dict[str, Any], data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Replaces inline series/axis data with `encode` mappings onto the dataset
+    built by to_echart_dataset. Charts whose values are not a one-to-one view of
+    the rows (pivoted categorical charts, repeated x values) keep inline data.
+    
+    Returns:
+        ECharts configuration
+    """
+    series_list = chart_config.get("series", [])
+    if not series_list:
+        return chart_config
+    
+    if series_list[0].get("type") == "pie":
+        name_column, value_column = identify_value_and_name_columns(data)
+        # The inline pie drops rows whose value does not parse
+        if len(series_list[0].get("data", [])) != len(data):
+            return chart_config
+        series_list[0].pop("data", None)
+        series_list[0]["encode"] = {"itemName": name_column, "value": value_column}
+        chart_config.get("legend", {}).pop("data", None)
+        return chart_config
+    
+    x_column, y_columns = identify_axes(data)
+    x_axis = chart_config.get("xAxis", {})
+    if len(x_axis.get("data", [])) != len(data):
+        return chart_config
+    if [series.get("name") for series in series_list] != [y.strip() if isinstance(y, str) else y for y in y_columns]:
+        return chart_config
+    
+    x_axis.pop("data", None)
+    for series, y_column in zip(series_list, y_columns):
+        series.pop("data", None)
+        series["encode"] = {"x": x_column, "y": y_column}
+    return chart_config
+
+def to_number(val: Any) -> Optional[float]:
+    """
+    Converts a cell value to a float, accepting Athena's string encoding
+    (e.g. "1,234.50"). Returns None for anything that is not numeric.
+    """
+    if isinstance(val, bool):
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+    if isinstance(val, str):
+        try:
+            return float(val.replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+def is_time_column(key: Any, sample: List[Any]) -> bool:
+    """
+    Detects date/period columns from the column name and the sampled values.
+    
+    Returns:
+        True if the column holds dates, months, years or similar periods
+    """
+    values = [str(v).strip().lower() for v in sample if v is not None and str(v).strip()]
+    if not values:
+        return False
+    
+    # Values that look like dates or month names are time regardless of the name
+    date_like = sum(1 for v in values if DATE_PATTERN.match(v) or v in MONTH_NAMES)
+    if date_like / len(values) >= 0.8:
+        return True
+    
+    # Otherwise the name has to say so, e.g. "invoice_month" or "year"
+    tokens = set(re.split(r"[^a-z0-9]+", str(key).lower()))
+    if not tokens & TIME_NAME_TOKENS:
+        return False
+    numbers = [to_number(v) for v in values]
+    if any(n is None for n in numbers):
+        return True
+    # Numeric time columns are years or small period indexes, not measures
+    return all(n == int(n) and (1900 <= n <= 2100 or 1 <= n <= 53) for n in numbers)
+
+def profile_columns(data: List[Dict[str, Any]], sample_size: int = 50) -> List[Dict[str, Any]]:
+    """
+    Builds a per-column profile used by the local chart classifier.
+    
+    Args:
+        data: List of data dictionaries
+        sample_size: Number of rows inspected for type detection
+        
+    Returns:
+        List of dicts with keys 'key', 'kind' ('time', 'numeric' or 'category')
+        and 'unique_count', in column order
+    """
+    profile = []
+    sample_rows = data[:sample_size]
+    for key in data[0].keys():
+        sample = [row.get(key) for row in sample_rows if row.get(key) not in (None, "", "NULL")]
+        numeric_count = sum(1 for val in sample if to_number(val) is not None)
+        numeric_ratio = numeric_count / len(sample) if sample else 0
+        
+        if is_time_column(key, sample):
+            kind = "time"
+        elif numeric_ratio > 0.8:
+            kind = "numeric"
+        else:
+            kind = "category"
+        
+        profile.append({
+            "key": key,
+            "kind": kind,
+            "unique_count": len(set(str(row.get(key, "")) for row in data))
+        })
+    return profile
+
+def humanize_column(key: Any) -> str:
+    """Turns a column name such as 'total_freight_cost' into 'Total Freight Cost'."""
+    words = re.split(r"[_\s]+", str(key).strip())
+    return " ".join(word.capitalize() for word in words if word)
+
+def join_columns(keys: List[Any]) -> str:
+    """Joins humanized column names for use in a chart title."""
+    names = [humanize_column(k) for k in keys]
+    if len(names) <= 1:
+        return "".join(names)
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+def is_part_to_whole(data: List[Dict[str, Any]], value_column: Any) -> bool:
+    """
+    Checks whether a value column describes shares of a whole, either by name
+    (percent, share, ...) or because its values sum to 100 or 1.
+    """
+    tokens = set(re.split(r"[^a-z0-9]+", str(value_column).lower()))
+    if tokens & PART_TO_WHOLE_TOKENS:
+        return True
+    values = [to_number(row.get(value_column)) for row in data]
+    if any(v is None for v in values):
+        return False
+    total = sum(values)
+    return abs(total - 100) <= 0.5 or abs(total - 1) <= 0.005
+
+def classify_chart(data: List[Dict[str, Any]], profile: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Deterministically picks a chart type from the column profile: time-column
+    detection, cardinality and part-to-whole checks. Mirrors the guidance given
+    to Claude in analyze_with_bedrock.
+    
+    Args:
+        data: List of data dictionaries
+        profile: Optional precomputed result of profile_columns
+        
+    Returns:
+        Dict with keys 'type', 'sub_type', 'description' and 'confidence' (0-1)
+    """
+    if profile is None:
+        profile = profile_columns(data)
+    
+    time_cols = [c for c in profile if c["kind"] == "time"]
+    numeric_cols = [c for c in profile if c["kind"] == "numeric"]
+    category_cols = [c for c in profile if c["kind"] == "category" and c["unique_count"] > 1]
+    measures = [c["key"] for c in numeric_cols][:5]
+    
+    # Nothing to plot against - let Claude decide if it is asked at all
+    if not numeric_cols:
+        return {"type": "bar", "sub_type": None, "description": "", "confidence": 0.2}
+    
+    # Time series
+    if time_cols:
+        time_col = time_cols[0]
+        groups = [c for c in category_cols if 2 <= c["unique_count"] <= 10]
+        if groups and time_col["unique_count"] < len(data):
+            return {
+                "type": "categorical",
+                "sub_type": None,
+                "description": f"{humanize_column(measures[0])} by {humanize_column(time_col['key'])} and {humanize_column(groups[0]['key'])}",
+                "confidence": 0.85
+            }
+        chart_type = "trend" if time_col["unique_count"] >= TREND_MIN_POINTS else "line"
+        return {
+            "type": chart_type,
+            "sub_type": None,
+            "description": f"{join_columns(measures)} over {humanize_column(time_col['key'])}",
+            "confidence": 0.85
+        }
+    
+    # Numbers only, no obvious labels
+    if not category_cols:
+        return {"type": "bar", "sub_type": None, "description": join_columns(measures), "confidence": 0.4}
+    
+    # Two or more grouping columns could be a comparative chart or a plain bar
+    if len(category_cols) >= 2 and any(2 <= c["unique_count"] <= 10 for c in category_cols):
+        return {
+            "type": "categorical",
+            "sub_type": None,
+            "description": f"{humanize_column(measures[0])} by {join_columns([c['key'] for c in category_cols[:2]])}",
+            "confidence": 0.6
+        }
+    
+    name_col = category_cols[0]
+    # Name/value pairs with few slices are part-to-whole candidates
+    if len(numeric_cols) == 1 and name_col["unique_count"] <= PIE_MAX_CATEGORIES:
+        values = [to_number(row.get(measures[0])) for row in data]
+        if all(v is not None and v >= 0 for v in values):
+            part_to_whole = is_part_to_whole(data, measures[0])
+            return {
+                "type": "pie",
+                "sub_type": None,
+                "description": f"Share of {humanize_column(measures[0])} by {humanize_column(name_col['key'])}",
+                "confidence": 0.9 if part_to_whole else 0.75
+            }
+    
+    return {
+        "type": "bar",
+        "sub_type": None,
+        "description": f"{join_columns(measures)} by {humanize_column(name_col['key'])}",
+        "confidence": 0.85 if name_col["unique_count"] > PIE_MAX_CATEGORIES or len(numeric_cols) > 1 else 0.7
+    }
+
+def hint_fits_shape(chart_type: str, data: List[Dict[str, Any]], profile: List[Dict[str, Any]]) -> bool:
+    """
+    Checks whether a chart type proposed before the query ran can be drawn
+    from the columns that actually came back.
+    """
+    time_cols = [c for c in profile if c["kind"] == "time"]
+    numeric_cols = [c for c in profile if c["kind"] == "numeric"]
+    category_cols = [c for c in profile if c["kind"] == "category" and c["unique_count"] > 1]
+    
+    if chart_type not in CHART_TYPES or not numeric_cols:
+        return False
+    if chart_type in ("line", "trend"):
+        return bool(time_cols)
+    if chart_type == "pie":
+        if not any(c["unique_count"] <= PIE_MAX_CATEGORIES for c in category_cols + time_cols):
+            return False
+        values = [to_number(row.get(numeric_cols[0]["key"])) for row in data]
+        return all(v is not None and v >= 0 for v in values)
+    if chart_type == "categorical":
+        return len(time_cols) + len(category_cols) >= 2
+    return True
+
+def chart_info_from_hint(chart_hint: Dict[str, Any], data: List[Dict[str, Any]], profile: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Converts the chart hint from the SQL generation call into chart info.
+    
+    Returns:
+        Dict with keys 'type', 'description' and 'sub_type', or None if the
+        hint is malformed or does not fit the result shape
+    """
+    if not isinstance(chart_hint, dict):
+        return None
+    chart_type = str(chart_hint.get("type") or "").strip().lower()
+    if not hint_fits_shape(chart_type, data, profile):
+        return None
+    
+    sub_type = chart_hint.get("sub_type")
+    sub_type = str(sub_type).strip().lower() if sub_type else None
+    if sub_type in ("none", "n/a", ""):
+        sub_type = None
+    
+    title = str(chart_hint.get("title") or "").strip()
+    if not title:
+        title = classify_chart(data, profile)["description"]
+    return {"type": chart_type, "description": title, "sub_type": sub_type}
+
+def cardinality_bucket(unique_count: int) -> int:
+    """Maps a distinct-value count to the index of its bucket in CARDINALITY_BUCKETS."""
+    for i, upper in enumerate(CARDINALITY_BUCKETS):
+        if unique_count <= upper:
+            return i
+    return len(CARDINALITY_BUCKETS)
+
+def shape_signature(profile: List[Dict[str, Any]]) -> str:
+    """
+    Builds a cache key from column names, inferred types and cardinality
+    buckets, so reruns of the same question map to the same recommendation.
+    """
+    shape = [[str(c["key"]), c["kind"], cardinality_bucket(c["unique_count"])] for c in profile]
+    return hashlib.sha256(json.dumps(shape).encode("utf-8")).hexdigest()
+
+def get_cached_chart_info(signature: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cached chart recommendation for a shape signature, or None if
+    it is missing or expired.
+    """
+    entry = _chart_cache.get(signature)
+    if entry is None:
+        return None
+    expires_at, chart_info = entry
+    if expires_at < time.monotonic():
+        del _chart_cache[signature]
+        return None
+    _chart_cache.move_to_end(signature)
+    return dict(chart_info)
+
+def cache_chart_info(signature: str, chart_info: Dict[str, Any]):
+    """Stores a chart recommendation, evicting the least recently used entries."""
+    _chart_cache[signature] = (
+        time.monotonic() + CHART_CACHE_TTL_SECONDS,
+        {k: chart_info.get(k) for k in ("type", "sub_type", "description")}
+    )
+    _chart_cache.move_to_end(signature)
+    while len(_chart_cache) > CHART_CACHE_MAX_ENTRIES:
+        _chart_cache.popitem(last=False)
+
 def analyze_with_bedrock(
     sample_data: List[Dict[str, Any]], 
     bedrock_client,
@@ -287,8 +777,7 @@ def format_bar_chart(data: List[Dict[str, Any]], sub_type: str = None) -> Dict[s
     seen_values = set()
     
     for row in data:
-        val = row[x_column]
-        val_str = str(val).strip()
+        val_str = axis_label(row[x_column])
         if val_str not in seen_values:
             x_values.append(val_str)
             seen_values.add(val_str)
@@ -302,14 +791,7 @@ def format_bar_chart(data: List[Dict[str, Any]], sub_type: str = None) -> Dict[s
         value_map = {}
         for row in data:
             try:
-                x_val = str(row[x_column]).strip()
-                y_val = row[y_col]
-                # Convert to float if possible
-                if isinstance(y_val, str):
-                    y_val = float(y_val.replace(',', ''))
-                else:
-                    y_val = float(y_val) if y_val is not None else 0
-                value_map[x_val] = y_val
+                value_map[axis_label(row[x_column])] = series_value(row[y_col])
             except (ValueError, TypeError):
                 continue
         
@@ -365,8 +847,7 @@ def format_line_chart(data: List[Dict[str, Any]], sub_type: str = None) -> Dict[
     seen_values = set()
     
     for row in data:
-        val = row[x_column]
-        val_str = str(val).strip()
+        val_str = axis_label(row[x_column])
         if val_str not in seen_values:
             x_values.append(val_str)
             seen_values.add(val_str)
@@ -380,14 +861,7 @@ def format_line_chart(data: List[Dict[str, Any]], sub_type: str = None) -> Dict[
         value_map = {}
         for row in data:
             try:
-                x_val = str(row[x_column]).strip()
-                y_val = row[y_col]
-                # Convert to float if possible
-                if isinstance(y_val, str):
-                    y_val = float(y_val.replace(',', ''))
-                else:
-                    y_val = float(y_val) if y_val is not None else 0
-                value_map[x_val] = y_val
+                value_map[axis_label(row[x_column])] = series_value(row[y_col])
             except (ValueError, TypeError):
                 continue
         
@@ -446,14 +920,7 @@ def format_pie_chart(data: List[Dict[str, Any]], sub_type: str = None) -> Dict[s
     pie_data = []
     for row in data:
         try:
-            name = str(row[name_column]).strip()
-            value = row[value_column]
-            if isinstance(value, str):
-                value = float(value.replace(',', ''))
-            else:
-                value = float(value) if value is not None else 0
-                
-            pie_data.append({"name": name, "value": value})
+            pie_data.append({"name": axis_label(row[name_column]), "value": series_value(row[value_column])})
         except (ValueError, TypeError):
             continue
     
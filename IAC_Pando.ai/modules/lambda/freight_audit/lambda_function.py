@@ -1,5 +1,5 @@
 import json
-import boto3
+import os
 from prompt import SQL_GENERATION_PROMT, SQL_CORRECTION_PROMPT , E_CHARTS_GENERATION_PROMPT
 import logging
 import time
@@ -11,7 +11,12 @@ from gremlin_python.driver import client, serializer
 from gremlin_python.driver.protocol import GremlinServerError
 import ast
 import re
-from echart import data_to_echart
+import base64
+from array import array
+from echart import data_to_echart, to_echart_dataset, encoded_value_columns, encoded_label_columns, normalize_headers
+from schema_retriever import SchemaRetriever
+from aws_clients import get_client  # common layer
+from embedding_service import EmbeddingService, S3EmbeddingStore  # common layer
 
 REGION = "us-east-1"
 FIREHOSE_NAME = "observability_firehose-opensearch-stream"
@@ -32,11 +37,11 @@ bedrock_logs = Observability(
     feedback_variables=True
 )
 
-# AWS clients
-bedrock_client = boto3.client('bedrock-agent-runtime')
-bedrock_model_client = boto3.client(service_name="bedrock-runtime")
-athena_client = boto3.client("athena")
-s3_client = boto3.client("s3")
+# AWS clients, shared across warm invocations (pooled, keep-alive, adaptive retries)
+bedrock_client = get_client('bedrock-agent-runtime')
+bedrock_model_client = get_client("bedrock-runtime")
+athena_client = get_client("athena")
+s3_client = get_client("s3")
 
 # Athena settings
 DATABASE_NAME = "pando_invoice"
@@ -45,6 +50,43 @@ SCHEMA_KNOWLEDGE_BASE_ID = "QUXIDJXHOE"
 PREV_EXAMPLES_KNOWLEDGE_BASE_ID = "IXTFQ5BLSJ"
 SCORE_THRESHOLD = 0.90
 
+# Schema chunks returned per generation call; the schema KB holds column-group
+# documents with "database"/"table" metadata written by s3-kb
+SCHEMA_NUMBER_OF_RESULTS = int(os.environ.get("SCHEMA_NUMBER_OF_RESULTS", "8"))
+SCHEMA_KB_DATABASE = os.environ.get("SCHEMA_KB_DATABASE")
+
+# "local" searches the s3-kb index in-process (BM25 + embeddings) and falls
+# back to the knowledge base; "bedrock" always calls the knowledge base
+SCHEMA_RETRIEVER = os.environ.get("SCHEMA_RETRIEVER", "local")
+SCHEMA_INDEX_BUCKET = os.environ.get("SCHEMA_INDEX_BUCKET", "pando-db-auto-schema-artifacts")
+SCHEMA_INDEX_KEY = os.environ.get("SCHEMA_INDEX_KEY", f"schema-kb/index/{SCHEMA_KB_DATABASE or 'pando-db-pg'}.json.gz")
+schema_retriever = SchemaRetriever(s3_client, SCHEMA_INDEX_BUCKET, SCHEMA_INDEX_KEY)
+
+# Query embeddings are shared by the Neptune concept matcher and the schema
+# retriever: cached in memory per container and, when EMBEDDING_CACHE_BUCKET
+# is set, in S3 across containers. The S3 tier is opt-in because it adds one
+# GET to every memory miss; never point it at a knowledge base data source
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_BUCKET = os.environ.get("EMBEDDING_CACHE_BUCKET")
+EMBEDDING_CACHE_PREFIX = os.environ.get("EMBEDDING_CACHE_PREFIX", "freight-audit/embedding-cache/")
+embedding_service = EmbeddingService(
+    bedrock_model_client,
+    cache_size=EMBEDDING_CACHE_SIZE,
+    store=S3EmbeddingStore(s3_client, EMBEDDING_CACHE_BUCKET, EMBEDDING_CACHE_PREFIX) if EMBEDDING_CACHE_BUCKET else None
+)
+
+# Appended to the SQL generation prompt so the same call also proposes the
+# chart, saving the separate chart-selection round trip in data_to_echart
+CHART_HINT_INSTRUCTIONS = """
+
+In addition to "SQL" and "Reasoning", include a "Chart" key in the same JSON object describing how the query result should be visualized:
+"Chart": {"type": "<one of: line, bar, pie, trend, categorical>", "sub_type": "<optional, e.g. stacked, area, smooth, doughnut, or null>", "title": "<one-sentence chart title>"}
+- Use 'line' or 'trend' when the result is tracked over dates, months or years ('trend' when the overall direction matters)
+- Use 'pie' for part-to-whole results with a single value column and fewer than 10 categories
+- Use 'categorical' when values are compared across a category and a time period
+- Otherwise use 'bar'
+"""
+
 @bedrock_logs.watch(capture_input=True, capture_output=True, call_type='freight-audit-AI')
 def invoke_model(payload, model_id):
     try:
@@ -113,6 +155,7 @@ def sql_generator(prompt):
         content = json.loads(response_json["content"][0]["text"])
         sql = content["SQL"]
         reasoning = content["Reasoning"]
+        chart_hint = content.get("Chart") if isinstance(content.get("Chart"), dict) else None
         logger.info("SQL and reasoning extracted from response")
     except (KeyError, json.JSONDecodeError) as e:
         logger.error(f"Invalid Bedrock response format: {str(e)}")
@@ -122,6 +165,7 @@ def sql_generator(prompt):
         "prompt": prompt,
         "reasoning": reasoning,
         "sql": sql,
+        "chart": chart_hint,
         "run_id": run_id,
         "observation_id": observation_id,
         "latency": response_metadata['latency'],
@@ -130,7 +174,7 @@ def sql_generator(prompt):
     }
     logger.debug(f"Generated output JSON: {json.dumps(output_json)}")
     write_into_s3(output_json)
-    return sql, reasoning
+    return sql, reasoning, chart_hint
 
 def echart_generator(prompt):
     payload = {
@@ -226,24 +270,17 @@ def execute_query(query_string):
     results = athena_client.get_query_results(QueryExecutionId=query_execution_id)
     logger.info("Query executed successfully, processing results")
     rows = []
-    headers = [col["VarCharValue"] for col in results["ResultSet"]["Rows"][0]["Data"]]
+    headers = [col["VarCharValue"].strip() for col in results["ResultSet"]["Rows"][0]["Data"]]
     for row in results["ResultSet"]["Rows"][1:]:
         rows.append({headers[i]: col.get("VarCharValue", "NULL") for i, col in enumerate(row["Data"])})
     return {"database_records": rows}
 
 def get_titan_embedding(query):
-    bedrock = boto3.client(service_name='bedrock-runtime')
-    payload = {"inputText": query}
     logger.info(f"Generating Titan embedding for query: {query}")
-    response = bedrock.invoke_model(
-        modelId="amazon.titan-embed-text-v2:0",
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps(payload)
-    )
-    response_body = json.loads(response["body"].read().decode("utf-8"))
-    logger.info("Titan embedding generated successfully")
-    return response_body["embedding"]
+    embedding = embedding_service.embed(query)
+    logger.info(f"Titan embedding ready (cache hits: {embedding_service.hits}, "
+                f"store hits: {embedding_service.store_hits}, model calls: {embedding_service.misses})")
+    return embedding
 
 def cosine_similarity(vec1, vec2):
     dot_product = sum(a * b for a, b in zip(vec1, vec2))
@@ -253,6 +290,15 @@ def cosine_similarity(vec1, vec2):
     logger.debug(f"Computed cosine similarity: {similarity}")
     return similarity
 
+def decode_embedding(value):
+    """
+    Decodes a stored Concept embedding: either the compact "f32:<base64>" form
+    written by concept-embedder or the older "[0.1, 0.2, ...]" text form.
+    """
+    if value.startswith("f32:"):
+        return array("f", base64.b64decode(value[4:])).tolist()
+    return ast.literal_eval(value)
+
 def get_embedding_by_query(gremlin_client, query_text):
     """Fetch embedding for the Concept node based on the query description."""
     gremlin_query = f"""
@@ -268,7 +314,7 @@ def get_embedding_by_query(gremlin_client, query_text):
         if embedding and embedding[0]:
             # Convert string embedding to list
             try:
-                embedding_list = ast.literal_eval(embedding[0])
+                embedding_list = decode_embedding(embedding[0])
                 return embedding_list
             except (ValueError, SyntaxError) as e:
                 logger.error(f"Failed to parse embedding for {query_text}: {str(e)}")
@@ -276,6 +322,28 @@ def get_embedding_by_query(gremlin_client, query_text):
     logger.info(f"No results found for query: {query_text}")
     return None
 
+def column_property(column, name, default=None):
+    """Reads a single-valued property from a Gremlin valueMap(true) result."""
+    value = column.get(name)
+    return value[0] if value else default
+
+def column_profile_text(column):
+    """Formats the value profile written by schema-extractor, if the Column vertex has one."""
+    parts = []
+    if column_property(column, 'approx_distinct') is not None:
+        parts.append(f"Distinct: ~{column_property(column, 'approx_distinct')}")
+    if column_property(column, 'null_rate') is not None:
+        parts.append(f"Nulls: {float(column_property(column, 'null_rate')):.1%}")
+    if column_property(column, 'min_value') is not None or column_property(column, 'max_value') is not None:
+        parts.append(f"Range: {column_property(column, 'min_value')} .. {column_property(column, 'max_value')}")
+    if column_property(column, 'top_values'):
+        try:
+            values = json.loads(column_property(column, 'top_values'))
+            parts.append("Values: " + ", ".join(f"'{value}'" for value in values))
+        except ValueError:
+            pass
+    return "".join(f" | {part}" for part in parts)
+
 def get_neptune_output(input_query):
     neptune_endpoint = "wss://db-neptune-1.cluster-ro-cpu28yegypjp.us-east-1.neptune.amazonaws.com:8182/gremlin"
     
@@ -367,7 +435,10 @@ def get_neptune_output(input_query):
             
             for column in columns:
                 column_name = column['name'][0]
-                table_output.append(f"{DATABASE_NAME}.{table_name}.{column_name} | Type:  | Description: ")
+                table_output.append(
+                    f"{DATABASE_NAME}.{table_name}.{column_name} | Type: {column_property(column, 'data_type', '')} "
+                    f"| Description: {column_property(column, 'comment', '')}{column_profile_text(column)}"
+                )
             
             output.append("\n".join(table_output))
         
@@ -378,6 +449,61 @@ def get_neptune_output(input_query):
         if 'gremlin_client' in locals():
             gremlin_client.close()
 
+def tables_in_schema_text(schema_text):
+    """Table names from "Table: db.table" lines, e.g. of the Neptune output."""
+    if not isinstance(schema_text, str):
+        return []
+    return sorted(set(re.findall(r"^Table: [^.\n]+\.(\S+)$", schema_text, flags=re.MULTILINE)))
+
+def schema_retrieval_filter(tables):
+    """Bedrock KB metadata filter for the given tables and SCHEMA_KB_DATABASE, or None."""
+    filters = []
+    if SCHEMA_KB_DATABASE:
+        filters.append({"equals": {"key": "database", "value": SCHEMA_KB_DATABASE}})
+    if tables:
+        filters.append({"in": {"key": "table", "value": tables}})
+    if len(filters) > 1:
+        return {"andAll": filters}
+    return filters[0] if filters else None
+
+def retrieve_schema(query_text, tables=None):
+    """
+    Retrieves the top schema chunks, restricted to the given tables when known.
+    Falls back to an unfiltered search if the filtered one returns nothing.
+    Uses the in-process retriever unless SCHEMA_RETRIEVER is "bedrock" or it fails.
+    """
+    if SCHEMA_RETRIEVER == "local":
+        try:
+            results = schema_retriever.search(
+                query_text, SCHEMA_NUMBER_OF_RESULTS, tables=tables,
+                database=SCHEMA_KB_DATABASE, embed=get_titan_embedding
+            )
+            if results:
+                return results
+            logger.info("Local schema index is empty, using the knowledge base")
+        except Exception as e:
+            logger.warning(f"Local schema retrieval failed, using the knowledge base: {str(e)}")
+
+    vector_config = {"numberOfResults": SCHEMA_NUMBER_OF_RESULTS}
+    retrieval_filter = schema_retrieval_filter(tables)
+    if retrieval_filter:
+        response = bedrock_client.retrieve(
+            knowledgeBaseId=SCHEMA_KNOWLEDGE_BASE_ID,
+            retrievalQuery={"text": query_text},
+            retrievalConfiguration={"vectorSearchConfiguration": {**vector_config, "filter": retrieval_filter}}
+        )
+        results = response.get("retrievalResults", [])
+        if results:
+            return [item["content"]["text"] for item in results]
+        logger.info(f"No schema chunks matched filter {json.dumps(retrieval_filter)}, retrying unfiltered")
+
+    response = bedrock_client.retrieve(
+        knowledgeBaseId=SCHEMA_KNOWLEDGE_BASE_ID,
+        retrievalQuery={"text": query_text},
+        retrievalConfiguration={"vectorSearchConfiguration": vector_config}
+    )
+    return [item["content"]["text"] for item in response.get("retrievalResults", [])]
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
     try:
@@ -395,6 +521,8 @@ def lambda_handler(event, context):
         client_id = body.get("client_id")
         user_id = body.get("user_id")
         query_text = body.get("query")
+        # "compact" returns the rows once, as an ECharts dataset shared with the chart
+        compact = body.get("response_format") == "compact"
 
         if not client_id or not user_id or not query_text:
             logger.error("Missing required parameters: client_id, user_id, or query")
@@ -404,11 +532,7 @@ def lambda_handler(event, context):
         neptune_output = get_neptune_output(query_text)
         
         logger.info("Retrieving schema from knowledge base")
-        response = bedrock_client.retrieve(
-            knowledgeBaseId=SCHEMA_KNOWLEDGE_BASE_ID,
-            retrievalQuery={"text": query_text}
-        )
-        schema_filtered = [item["content"]["text"] for item in response.get("retrievalResults", [])]
+        schema_filtered = retrieve_schema(query_text, tables_in_schema_text(neptune_output))
 
         logger.info("Retrieving previous examples from knowledge base")
         response = bedrock_client.retrieve(
@@ -423,7 +547,7 @@ def lambda_handler(event, context):
         sql_gen_prompt = SQL_GENERATION_PROMT.format(
             schema=schema_filtered, prev_examples=top3_prev_examples, 
             user_query=query_text, client_id=client_id, user_id=user_id, neptune_output=neptune_output
-        )
+        ) + CHART_HINT_INSTRUCTIONS
         
         attempt = 0
         max_attempts = 3
@@ -432,7 +556,7 @@ def lambda_handler(event, context):
         while attempt < max_attempts:
             logger.info(f"SQL generation attempt {attempt + 1} of {max_attempts}")
             try:
-                generated_sql, reasoning = sql_generator(prompt)
+                generated_sql, reasoning, chart_hint = sql_generator(prompt)
                 syntaxcheckmsg = syntax_checker(generated_sql)
                 if syntaxcheckmsg == "Passed":
                     logger.info("Syntax check passed, executing query")
@@ -445,13 +569,32 @@ def lambda_handler(event, context):
                             return_records["database_records"],
                             use_ai=True,
                             bedrock_client=bedrock_model_client,
-                            model_id=INFERENCE_PROFILE_ARN
+                            model_id=INFERENCE_PROFILE_ARN,
+                            chart_hint=chart_hint,
+                            compact=compact
                             )
                         logger.info("Echarts executed successfully, returning response")
                     else:
                         chart_config = "Not enough records to generate echart"
                         logger.info("Not enough records to generate echart")
                     
+                    if compact:
+                        # Render with setOption({...Echarts, dataset: Dataset})
+                        dataset = to_echart_dataset(
+                            normalize_headers(return_records["database_records"]),
+                            value_columns=encoded_value_columns(chart_config),
+                            label_columns=encoded_label_columns(chart_config)
+                        )
+                        return {
+                            "statusCode": 200,
+                            "body": json.dumps({
+                                "SQL": generated_sql,
+                                "Reasoning": reasoning,
+                                "Dataset": dataset,
+                                "Echarts": chart_config
+                            }, separators=(",", ":"))
+                        }
+                    
                     return {
                         "statusCode": 200,
                         "body": json.dumps({
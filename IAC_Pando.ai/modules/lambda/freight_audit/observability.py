@@ -1,8 +1,8 @@
 import pytz
 import json
 import time
-import boto3
 import logging
+from aws_clients import get_client  # common layer
 #import requests
 import asyncio
 from uuid import uuid4
@@ -32,7 +32,7 @@ class FirehoseDestination(LoggingDestination):
     def __init__(self, delivery_stream_name: str):
         """Initialize Firehose destination with stream name."""
         self.__delivery_stream_name = delivery_stream_name
-        self.__client = boto3.client('firehose')
+        self.__client = get_client('firehose')
 
     def send_log(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Send log data to Firehose."""
@@ -0,0 +1,201 @@
+import base64
+import gzip
+import json
+import logging
+import math
+import operator
+import re
+import time
+from array import array
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# In-process hybrid search over the schema documents published by s3-kb.
+# s3-kb writes one index object per database to its artifact bucket
+# (schema-kb/index/<database>.json.gz):
+#   {"model", "dimensions",
+#    "documents": [{"key", "hash", "text", "metadata": {"database", "table", ...}}],
+#    "vectors": base64 float32 matrix, one normalized row per document}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant; 60 is the usual choice and keeps either
+# ranking from dominating
+RRF_K = 60
+
+# How long a loaded index is trusted before its ETag is checked again
+DEFAULT_REFRESH_SECONDS = 300
+
+# ETag recorded when the index could not be loaded, so the next attempt waits
+# for the refresh interval like any other check
+MISSING_ETAG = "missing"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens; identifiers like invoice_date split into their words."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents."""
+
+    def __init__(self, texts: Iterable[str]):
+        self.__postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        self.__lengths = []
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.__lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.__postings[term].append((doc, tf))
+        count = len(self.__lengths)
+        self.__average_length = (sum(self.__lengths) / count) if count else 0.0
+        self.__idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.__postings.items()
+        }
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """Return {document index: score} for documents sharing a term with the query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.__idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.__postings[term]:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.__lengths[doc] / (self.__average_length or 1))
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+class SchemaRetriever:
+    """Hybrid BM25 + embedding retriever over the s3-kb schema index, loaded once per container."""
+
+    def __init__(self, s3_client, bucket: str, key: str, refresh_seconds: int = DEFAULT_REFRESH_SECONDS):
+        """
+        Initialize the retriever. The index is loaded on the first search.
+
+        Args:
+            s3_client: boto3 s3 client
+            bucket: s3-kb artifact bucket
+            key: Index object key, e.g. "schema-kb/index/pando-db-pg.json.gz"
+            refresh_seconds: Age after which the index ETag is re-checked
+        """
+        self.__s3_client = s3_client
+        self.__bucket = bucket
+        self.__key = key
+        self.__refresh_seconds = refresh_seconds
+        self.__etag = None
+        self.__checked_at = 0.0
+        self.__documents = []
+        self.__vectors = []
+        self.__dimensions = 0
+        self.__bm25 = None
+
+    def search(self,
+               query: str,
+               k: int,
+               tables: Optional[List[str]] = None,
+               database: Optional[str] = None,
+               embed: Optional[Callable[[str], List[float]]] = None) -> List[str]:
+        """
+        Return the texts of the top-k documents for a query.
+
+        BM25 and embedding rankings are merged with reciprocal rank fusion.
+        Documents are restricted to the given tables/database like the
+        Bedrock metadata filter; when that leaves nothing, all documents are
+        searched.
+
+        Args:
+            query: User question
+            k: Number of documents to return
+            tables: Optional table names to restrict to
+            database: Optional database to restrict to
+            embed: Function returning the query embedding; without it (or if
+                the index has no vectors) only BM25 is used
+
+        Returns:
+            Document texts, best first
+        """
+        self.__ensure_loaded()
+        if not self.__documents:
+            return []
+
+        candidates = self.__filter(tables, database) or set(range(len(self.__documents)))
+
+        bm25 = self.__bm25.scores(query)
+        rankings = [sorted((doc for doc in bm25 if doc in candidates), key=lambda doc: -bm25[doc])]
+
+        if embed is not None and self.__vectors:
+            query_vector = embed(query)
+            if len(query_vector) == self.__dimensions:
+                norm = math.sqrt(sum(v * v for v in query_vector)) or 1.0
+                query_vector = [v / norm for v in query_vector]
+                similarity = {doc: sum(map(operator.mul, query_vector, self.__vectors[doc])) for doc in candidates}
+                rankings.append(sorted(similarity, key=lambda doc: -similarity[doc]))
+            else:
+                logger.warning(f"Query embedding has {len(query_vector)} dimensions, index has {self.__dimensions}")
+
+        fused = defaultdict(float)
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                fused[doc] += 1.0 / (RRF_K + rank + 1)
+        top = sorted(fused, key=lambda doc: -fused[doc])[:k]
+        return [self.__documents[doc]["text"] for doc in top]
+
+    def __filter(self, tables: Optional[List[str]], database: Optional[str]) -> set:
+        """Indexes of documents matching the table/database restriction (empty if none given)."""
+        if not tables and not database:
+            return set()
+        wanted = set(tables or [])
+        return {
+            doc for doc, entry in enumerate(self.__documents)
+            if (not wanted or entry["metadata"].get("table") in wanted)
+            and (not database or entry["metadata"].get("database") == database)
+        }
+
+    def __ensure_loaded(self):
+        """
+        Load the index on first use and reload it when s3-kb has republished it.
+
+        S3 is asked at most once per refresh interval: a missing index or a
+        failed check is remembered (as MISSING_ETAG with no documents, or by
+        keeping the loaded index) until the interval has passed.
+        """
+        now = time.monotonic()
+        if self.__etag is not None and now - self.__checked_at < self.__refresh_seconds:
+            return
+        self.__checked_at = now
+        try:
+            if self.__etag not in (None, MISSING_ETAG):
+                etag = self.__s3_client.head_object(Bucket=self.__bucket, Key=self.__key)["ETag"]
+                if etag == self.__etag:
+                    return
+            self.__load()
+        except Exception as e:
+            logger.warning(f"Could not load schema index s3://{self.__bucket}/{self.__key}: {e}")
+            if self.__etag is None:
+                self.__etag = MISSING_ETAG
+
+    def __load(self):
+        start = time.perf_counter()
+        response = self.__s3_client.get_object(Bucket=self.__bucket, Key=self.__key)
+        index = json.loads(gzip.decompress(response["Body"].read()))
+
+        self.__documents = index["documents"]
+        self.__dimensions = index.get("dimensions", 0)
+        matrix = array("f", base64.b64decode(index.get("vectors", "")))
+        if self.__dimensions and len(matrix) == self.__dimensions * len(self.__documents):
+            self.__vectors = [matrix[i * self.__dimensions:(i + 1) * self.__dimensions]
+                              for i in range(len(self.__documents))]
+        else:
+            self.__vectors = []
+        self.__bm25 = BM25Index(entry["text"] for entry in self.__documents)
+        self.__etag = response["ETag"]
+        logger.info(f"Loaded schema index s3://{self.__bucket}/{self.__key}: {len(self.__documents)} documents "
+                    f"in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,109 @@
+"""
+The compact response (Echarts with `encode` + Dataset) must draw the same
+chart as the default response with inline series/xAxis data.
+
+Run with: python -m pytest freight_audit/tests
+"""
+import copy
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import echart  # noqa: E402
+
+ROWS = {
+    # Padded labels and headers, thousands separators and the "NULL" placeholder
+    "bar_with_nulls": [
+        {" lane ": " LANE-001 ", "freight_cost ": "1,200.50", "invoices": "12"},
+        {" lane ": "LANE-002", "freight_cost ": "NULL", "invoices": "7"},
+        {" lane ": "LANE-003  ", "freight_cost ": "980", "invoices": "NULL"},
+        {" lane ": "LANE-004", "freight_cost ": None, "invoices": "3"},
+    ],
+    "time_series": [
+        {"invoice_month": f"2024-{m:02d}", "total_cost": "NULL" if m == 5 else f"{m * 1000:,}"}
+        for m in range(1, 13)
+    ],
+    "pie": [
+        {"carrier": " UPS ", "pct_share": "40"},
+        {"carrier": "FedEx", "pct_share": "35"},
+        {"carrier": "DHL ", "pct_share": "25"},
+    ],
+    # A plotted column with no values at all (SQL NULLs arrive as None or "")
+    "all_null_values": [
+        {"carrier": "UPS", "credits": None},
+        {"carrier": "FedEx", "credits": None},
+        {"carrier": "DHL", "credits": ""},
+    ],
+    "pie_with_null": [
+        {"carrier": "UPS", "pct_share": "60"},
+        {"carrier": "FedEx", "pct_share": "NULL"},
+        {"carrier": "DHL", "pct_share": "40"},
+    ],
+}
+
+
+def resolve(chart, dataset):
+    """Expands a compact chart's `encode` mappings into inline data, as ECharts would."""
+    chart = copy.deepcopy(chart)
+    source = dataset["source"]
+    for series in chart["series"]:
+        encode = series.pop("encode", None)
+        if not encode:
+            continue
+        if "itemName" in encode:
+            series["data"] = [{"name": name, "value": value}
+                              for name, value in zip(source[encode["itemName"]], source[encode["value"]])]
+        else:
+            series["data"] = source[encode["y"]]
+            chart["xAxis"]["data"] = source[encode["x"]]
+    return chart
+
+
+def inline_and_compact(rows, chart_type):
+    inline = echart.chart_formatters[chart_type](echart.normalize_headers(copy.deepcopy(rows)))
+    compact = echart.compact_chart_config(
+        echart.chart_formatters[chart_type](echart.normalize_headers(copy.deepcopy(rows))),
+        echart.normalize_headers(rows)
+    )
+    dataset = echart.to_echart_dataset(
+        echart.normalize_headers(rows),
+        value_columns=echart.encoded_value_columns(compact),
+        label_columns=echart.encoded_label_columns(compact)
+    )
+    return inline, compact, dataset
+
+
+@pytest.mark.parametrize("name,chart_type", [
+    ("bar_with_nulls", "bar"),
+    ("time_series", "line"),
+    ("time_series", "trend"),
+    ("pie", "pie"),
+    ("pie_with_null", "pie"),
+    ("all_null_values", "bar"),
+])
+def test_compact_draws_the_same_chart(name, chart_type, capsys):
+    inline, compact, dataset = inline_and_compact(ROWS[name], chart_type)
+    resolved = resolve(compact, dataset)
+    if chart_type == "pie":
+        # The legend lists the slices either way; ECharts takes them from the series
+        inline["legend"].pop("data", None)
+        resolved["legend"].pop("data", None)
+    assert resolved == inline
+
+
+def test_dataset_has_no_null_placeholder():
+    _, compact, dataset = inline_and_compact(ROWS["bar_with_nulls"], "bar")
+    assert echart.encoded_value_columns(compact)
+    for values in dataset["source"].values():
+        assert "NULL" not in values
+    assert dataset["source"]["lane"] == ["LANE-001", "LANE-002", "LANE-003", "LANE-004"]
+
+
+def test_all_null_column_is_plotted_as_zeros():
+    inline, compact, dataset = inline_and_compact(ROWS["all_null_values"], "bar")
+    assert echart.encoded_value_columns(compact) == ["credits"]
+    assert dataset["source"]["credits"] == [0, 0, 0]
+    assert inline["series"][0]["data"] == [0, 0, 0]
@@ -1,3 +1,33 @@
+## Shared Python modules for the Lambdas (common/python -> /opt/python)
+data "archive_file" "common_layer" {
+  type        = "zip"
+  source_dir  = "${path.module}/common"
+  output_path = "${path.module}/lambda_layer(common).zip"
+}
+
+resource "aws_lambda_layer_version" "common" {
+  layer_name          = "pando-lambda-common"
+  filename            = data.archive_file.common_layer.output_path
+  source_code_hash    = data.archive_file.common_layer.output_base64sha256
+  compatible_runtimes = ["python3.13"]
+}
+
+## Working files of the schema pipeline: the s3-kb manifest (schema-kb/manifest/),
+## the local retriever's search index (schema-kb/index/), schema-extractor's
+## snapshots and legacy ID maps (schema-extractor/), concept-embedder's vector
+## cache (concept-embedder/) and, when enabled,
+## freight_audit's embedding cache (freight-audit/embedding-cache/). pando-db-auto-schema
+## is the schema knowledge base data source and is ingested as a whole, so
+## nothing but schema documents and their metadata sidecars may be written there;
+## likewise athena-neptune-data/neptune-nodes-data/ is a Neptune bulk load source.
+resource "aws_s3_bucket" "schema_artifacts" {
+  bucket = "pando-db-auto-schema-artifacts"
+
+  tags = {
+    Name = "Schema pipeline artifacts"
+  }
+}
+
 ## Lambda Function Configuration
 resource "aws_lambda_function" "schema_extractor" {
   function_name    = "athena-schema-extractor"
@@ -19,11 +49,17 @@ resource "aws_lambda_function" "schema_extractor" {
     variables = {
       S3_BUCKET         = "athena-neptune-data"
       S3_TARGET_PATH    = "neptune-nodes-data/"
+      ARTIFACT_BUCKET   = aws_s3_bucket.schema_artifacts.bucket
       S3_OUTPUT_LOCATION = "s3://pando-freight-agent/output/"
+      SCHEMA_BACKEND     = "athena"
+      EXPORT_MODE        = "full"
+      ATHENA_MAX_CONCURRENCY = "5"
+      PROFILE_COLUMNS    = "false"
+      PROFILE_SAMPLE_PERCENT = "0"
     }
   }
    layers = [
-    "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python313:1"
+    aws_lambda_layer_version.common.arn
   ]
 }
 
@@ -56,6 +92,7 @@ resource "aws_iam_policy" "lambda_schema_extractor_policy" {
         Action = [
           "athena:StartQueryExecution",
           "athena:GetQueryExecution",
+          "athena:BatchGetQueryExecution",
           "athena:GetQueryResults"
         ],
         Resource = "*"
@@ -65,13 +102,38 @@ resource "aws_iam_policy" "lambda_schema_extractor_policy" {
         Action = [
           "s3:PutObject",
           "s3:GetObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload",
           "s3:ListBucket"
         ],
         Resource = [
+          "arn:aws:s3:::athena-neptune-data",
           "arn:aws:s3:::athena-neptune-data/*",
+          aws_s3_bucket.schema_artifacts.arn,
+          "${aws_s3_bucket.schema_artifacts.arn}/*",
           "arn:aws:s3:::pando-freight-agent/*"
         ]
       },
+      {
+        Effect = "Allow",
+        Action = [
+          "glue:GetDatabase",
+          "glue:GetTable",
+          "glue:GetTables",
+          "glue:GetPartitions"
+        ],
+        Resource = "*"
+      },
+      {
+        # Column profiling (PROFILE_COLUMNS) scans the table data itself
+        Effect = "Allow",
+        Action = [
+          "s3:GetObject",
+          "s3:ListBucket",
+          "s3:GetBucketLocation"
+        ],
+        Resource = "*"
+      },
       {
         Effect = "Allow",
         Action = [
@@ -100,6 +162,102 @@ data "archive_file" "lambda_code" {
 
 #------------------------
 
+resource "aws_iam_role" "lambda_exec_concept_embedder_role" {
+  name = "lambda_concept_embedder_role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action = "sts:AssumeRole",
+      Effect = "Allow",
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+}
+
+resource "aws_iam_policy" "lambda_concept_embedder_policy" {
+  name        = "lambda_concept_embedder_policy"
+  description = "Permissions for concept-embedder to read concepts, call Titan and write bulk-load files"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow",
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload",
+          "s3:ListBucket"
+        ],
+        Resource = [
+          "arn:aws:s3:::athena-neptune-data",
+          "arn:aws:s3:::athena-neptune-data/*",
+          aws_s3_bucket.schema_artifacts.arn,
+          "${aws_s3_bucket.schema_artifacts.arn}/*"
+        ]
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "bedrock:InvokeModel"
+        ],
+        Resource = "arn:aws:bedrock:*::foundation-model/amazon.titan-embed-text-v2:0"
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ],
+        Resource = "arn:aws:logs:*:*:*"
+      }
+    ]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "concept_embedder_policy_attachment" {
+  role       = aws_iam_role.lambda_exec_concept_embedder_role.name
+  policy_arn = aws_iam_policy.lambda_concept_embedder_policy.arn
+}
+
+data "archive_file" "concept_embedder" {
+  type        = "zip"
+  source_dir  = "${path.module}/concept-embedder"
+  output_path = "${path.module}/lambda_package(concept-embedder).zip"
+}
+
+resource "aws_lambda_function" "concept_embedder" {
+  function_name    = "concept-embedder"
+  role             = aws_iam_role.lambda_exec_concept_embedder_role.arn
+  handler          = "lambda_function.lambda_handler"
+  runtime          = "python3.13"
+  filename         = data.archive_file.concept_embedder.output_path
+  source_code_hash = data.archive_file.concept_embedder.output_base64sha256
+  timeout          = 900
+  memory_size      = 512
+
+  environment {
+    variables = {
+      S3_BUCKET            = "athena-neptune-data"
+      S3_TARGET_PATH       = "neptune-nodes-data/"
+      CONCEPT_LOAD_PATH    = "neptune-concept-data/"
+      ARTIFACT_BUCKET      = aws_s3_bucket.schema_artifacts.bucket
+      EMBEDDING_DIMENSIONS = "1024"
+      EMBED_CONCURRENCY    = "8"
+    }
+  }
+  layers = [
+    aws_lambda_layer_version.common.arn
+  ]
+}
+
+#------------------------
+
 
 resource "aws_iam_role" "lambda_exec_s3-kb_role" {
   name = "lambda_s3-kb_role"
@@ -128,6 +286,7 @@ resource "aws_iam_policy" "lambda_s3-kb_policy" {
         Action = [
           "athena:StartQueryExecution",
           "athena:GetQueryExecution",
+          "athena:BatchGetQueryExecution",
           "athena:GetQueryResults"
         ],
         Resource = "*"
@@ -137,13 +296,44 @@ resource "aws_iam_policy" "lambda_s3-kb_policy" {
         Action = [
           "s3:PutObject",
           "s3:GetObject",
+          "s3:DeleteObject",
           "s3:ListBucket"
         ],
         Resource = [
+          "arn:aws:s3:::pando-db-auto-schema",
           "arn:aws:s3:::pando-db-auto-schema/*",
+          aws_s3_bucket.schema_artifacts.arn,
+          "${aws_s3_bucket.schema_artifacts.arn}/*",
           "arn:aws:s3:::pando-freight-agent/*"
         ]
       },
+      {
+        Effect = "Allow",
+        Action = [
+          "glue:GetDatabase",
+          "glue:GetTable",
+          "glue:GetTables",
+          "glue:GetPartitions"
+        ],
+        Resource = "*"
+      },
+      {
+        # Column profiling (PROFILE_COLUMNS) scans the table data itself
+        Effect = "Allow",
+        Action = [
+          "s3:GetObject",
+          "s3:ListBucket",
+          "s3:GetBucketLocation"
+        ],
+        Resource = "*"
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "bedrock:InvokeModel"
+        ],
+        Resource = "arn:aws:bedrock:*::foundation-model/amazon.titan-embed-text-v2:0"
+      },
       {
         Effect = "Allow",
         Action = [
@@ -190,12 +380,23 @@ resource "aws_lambda_function" "lambda_s3-kb" {
   environment {
     variables = {
       S3_BUCKET         = "pando-db-auto-schema"
+      ARTIFACT_BUCKET   = aws_s3_bucket.schema_artifacts.bucket
       S3_OUTPUT_LOCATION = "s3://pando-freight-agent/output/"
+      SCHEMA_BACKEND     = "athena"
+      ATHENA_MAX_CONCURRENCY = "5"
+      PROFILE_COLUMNS    = "false"
+      PROFILE_SAMPLE_PERCENT = "0"
+      COLUMNS_PER_CHUNK  = "25"
+      BUILD_SCHEMA_INDEX = "true"
+      EMBED_CONCURRENCY  = "4"
     }
   }
 #    layers = [
 #     "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python313:1"
 #   ]
+  layers = [
+    aws_lambda_layer_version.common.arn
+  ]
 }
 
 # --------------------------------
@@ -292,6 +493,7 @@ data "archive_file" "freight_audit" {
   type        = "zip"
   source_dir  = "${path.module}/freight_audit"
   output_path = "${path.module}/lambda_package(freight_audit).zip"
+  excludes    = ["tests"]
 }
 
 
@@ -324,12 +526,21 @@ resource "aws_lambda_function" "lambda_freight_audit" {
       SCHEMA_KNOWLEDGE_BASE_ID = "QUXIDJXHOE" 
       PREV_EXAMPLES_KNOWLEDGE_BASE_ID = "IXTFQ5BLSJ"
       SCORE_THRESHOLD = 0.90    
+      SCHEMA_NUMBER_OF_RESULTS = "8"
+      SCHEMA_KB_DATABASE = "pando-db-pg"
+      SCHEMA_RETRIEVER = "local"
+      SCHEMA_INDEX_BUCKET = aws_s3_bucket.schema_artifacts.bucket
+      EMBEDDING_CACHE_SIZE = "1024"
+      # Optional S3 tier shared across containers; adds one GET per memory miss
+      # EMBEDDING_CACHE_BUCKET = aws_s3_bucket.schema_artifacts.bucket
+      EMBEDDING_CACHE_PREFIX = "freight-audit/embedding-cache/"
     }
   }
-#    layers = [
-#     "arn:aws:lambda:us-east-1:354602095398:layer:pytz-layer:2",
-#     "arn:aws:lambda:us-east-1:354602095398:layer:gremlin:2"
-#   ]
+  layers = [
+    "arn:aws:lambda:us-east-1:354602095398:layer:pytz-layer:2",
+    "arn:aws:lambda:us-east-1:354602095398:layer:gremlin:2",
+    aws_lambda_layer_version.common.arn
+  ]
 }
 
 resource "aws_lambda_permission" "public_invoke_freight_audit" {
@@ -1,91 +1,370 @@
-import boto3
-import time
+import os
+import json
+import gzip
+import base64
+import hashlib
+from array import array
+from schema_catalog import get_schema_backend  # common layer
+from athena_engine import AthenaQueryEngine  # common layer
+from column_profiler import ColumnProfiler, describe_profile, PROFILE_COLUMNS  # common layer
+from aws_clients import get_client  # common layer
+from embedding_service import EmbeddingService, embedding_key  # common layer
 
-# AWS Clients
-athena_client = boto3.client("athena")
-s3_client = boto3.client("s3")
+# Titan embedding calls in flight while building the schema index
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+
+# AWS Clients; the Bedrock pool matches the embedding workers
+athena_client = get_client("athena")
+s3_client = get_client("s3")
+bedrock_client = get_client("bedrock-runtime", max_pool_connections=EMBED_CONCURRENCY)
 
 # S3 bucket where output schema files will be stored
 S3_BUCKET = "pando-db-auto-schema"
 S3_OUTPUT_LOCATION = "s3://pando-freight-agent/ouput/"
 
+# Bounded concurrent Athena execution (ATHENA_MAX_CONCURRENCY queries in flight)
+athena_engine = AthenaQueryEngine(S3_OUTPUT_LOCATION, athena_client=athena_client)
+
+# Working files (manifest, search index) go to a separate bucket: everything in
+# S3_BUCKET is ingested by the schema knowledge base, which must only see schema
+# documents and their metadata sidecars
+ARTIFACT_BUCKET = os.environ.get("ARTIFACT_BUCKET", "pando-db-auto-schema-artifacts")
+
+# Per-database manifest of published document hashes
+MANIFEST_PREFIX = "schema-kb/manifest/"
+# Where earlier versions kept the manifest, inside S3_BUCKET; read once and removed
+LEGACY_MANIFEST_PREFIX = "_manifest/"
+
+# Tables wider than this are split into column-group documents; each document
+# gets a Bedrock metadata sidecar so retrieval can filter by database/table
+COLUMNS_PER_CHUNK = int(os.environ.get("COLUMNS_PER_CHUNK", "25"))
+METADATA_SUFFIX = ".metadata.json"
+
+# Search index for freight_audit's in-process schema retriever: document texts,
+# metadata and a float32 embedding matrix in one object per database, kept in
+# ARTIFACT_BUCKET next to the manifest
+INDEX_PREFIX = "schema-kb/index/"
+# Where earlier versions kept the index, inside S3_BUCKET; read once and removed
+LEGACY_INDEX_PREFIX = "_index/"
+BUILD_SCHEMA_INDEX = os.environ.get("BUILD_SCHEMA_INDEX", "true").lower() == "true"
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+EMBEDDING_DIMENSIONS = 1024
+
+# Same normalization and request as freight_audit's query embeddings, so
+# document and query vectors are comparable; the index itself is the cache
+embedding_service = EmbeddingService(
+    bedrock_client, EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS, max_workers=EMBED_CONCURRENCY
+)
+
+# Where table metadata comes from: "athena" (information_schema) or "glue" (Data Catalog)
+SCHEMA_BACKEND = os.environ.get("SCHEMA_BACKEND", "athena")
+
 def execute_athena_query(database, query):
     """Executes an Athena query and waits for results."""
-    response = athena_client.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={"Database": database},
-        ResultConfiguration={"OutputLocation": S3_OUTPUT_LOCATION}
-    )
-    
-    query_execution_id = response["QueryExecutionId"]
-    
-    # Wait for query to complete
-    while True:
-        status = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-        state = status["QueryExecution"]["Status"]["State"]
-        
-        if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
-            break
-        time.sleep(2)  # Wait before checking again
-    
-    if state != "SUCCEEDED":
-        raise Exception(f"Athena query failed: {state}")
-    
-    return query_execution_id
+    return athena_engine.run(database, query)
 
 def get_query_results(query_execution_id):
-    """Fetches Athena query results."""
-    results = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-    processed_results = []
-    for row in results["ResultSet"]["Rows"]:
-        processed_row = []
-        for col in row["Data"]:
-            processed_row.append(col.get("VarCharValue", "NULL"))  # Handle missing values safely
-        processed_results.append(processed_row)
-
-    return processed_results[1:]  # Skip header row
-
-def fetch_table_schema(database_name):
-    """Fetches table schema and writes to S3."""
-    
+    """Fetches all pages of Athena query results."""
+    return athena_engine.get_results(query_execution_id)  # Header row skipped
+
+def build_schema_document(database_name, table_name, columns, table_desc=None, part=None):
+    """
+    Builds the knowledge base document for one table.
+
+    columns: dicts with "name", "type", "comment" and optionally "partition_key"
+    and "profile" (see column_profiler).
+    part: optional (number, total) when the table is split into column groups.
+    """
+    # 2. Fetch table description
+    # query_desc = f"SELECT comment FROM information_schema.tables WHERE table_schema = '{database_name}' AND table_name = '{table_name}';"
+    # query_id = execute_athena_query(database_name, query_desc)
+    # table_desc = get_query_results(query_id)
+    # table_desc = table_desc[0][0] if table_desc else "No description available"
+    table_desc = table_desc if table_desc else "No description available"
+    content = f"Database: {database_name}\nTable: {database_name}.{table_name}\n"
+    if part:
+        content += f"Part: {part[0]} of {part[1]}\n"
+    content += f"Description: {table_desc}\n\nCOLUMNS:\n========\n\n"
+
+    for column in columns:
+        col_type = column["type"]
+        if column.get("partition_key"):
+            col_type += " (partition key)"
+        col_desc = column["comment"] if column["comment"] else "No description available"
+        content += f"{database_name}.{table_name}.{column['name']} | Type: {col_type} | Description: {col_desc}"
+        content += f"{describe_profile(column.get('profile'))}\n\n"
+
+    return content
+
+def schema_document_key(database_name, table_name, part=None):
+    """S3 key of the knowledge base document for one table or column group."""
+    if part:
+        return f"{database_name}_{table_name}__part{part}.txt"
+    return f"{database_name}_{table_name}.txt"
+
+def build_schema_chunks(database_name, table_name, columns, table_desc=None, columns_per_chunk=COLUMNS_PER_CHUNK):
+    """
+    Builds the documents for one table: a single document for narrow tables,
+    otherwise one per group of columns_per_chunk columns (in table order).
+    Partition keys are repeated in every group since most filters need them.
+    Each document gets a metadata sidecar with the database, table and the
+    names and types of its columns.
+
+    Returns:
+        {S3 key: content} including the sidecars
+    """
+    regular = [c for c in columns if not c.get("partition_key")]
+    partition_keys = [c for c in columns if c.get("partition_key")]
+    groups = [regular[i:i + columns_per_chunk] for i in range(0, len(regular), columns_per_chunk)] or [[]]
+
+    documents = {}
+    for number, group in enumerate(groups, start=1):
+        part = (number, len(groups)) if len(groups) > 1 else None
+        key = schema_document_key(database_name, table_name, number if part else None)
+        group = group + partition_keys
+        documents[key] = build_schema_document(database_name, table_name, group, table_desc, part)
+        documents[f"{key}{METADATA_SUFFIX}"] = json.dumps({
+            "metadataAttributes": {
+                "database": database_name,
+                "table": table_name,
+                "column_names": [c["name"] for c in group],
+                "column_types": sorted({c["type"] for c in group}),
+                "part": number,
+                "parts": len(groups)
+            }
+        }, indent=2, sort_keys=True)
+    return documents
+
+def document_of(key):
+    """Document key a metadata sidecar belongs to (the key itself for documents)."""
+    return key[:-len(METADATA_SUFFIX)] if key.endswith(METADATA_SUFFIX) else key
+
+def load_manifest(database_name):
+    """
+    Loads {document key: content hash} from the last publish, or {} on the
+    first run. Falls back to a manifest left in S3_BUCKET by earlier versions.
+    """
+    for bucket, key in ((ARTIFACT_BUCKET, f"{MANIFEST_PREFIX}{database_name}.json"),
+                        (S3_BUCKET, f"{LEGACY_MANIFEST_PREFIX}{database_name}.json")):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            continue
+        return json.loads(response["Body"].read()).get("documents", {})
+    return {}
+
+def publish_schema_documents(database_name, documents):
+    """
+    Uploads only new or changed documents and deletes documents of dropped
+    tables, using content hashes recorded in the manifest in ARTIFACT_BUCKET.
+
+    documents: {S3 key: document text} for every table in the database,
+    including metadata sidecars.
+
+    Returns:
+        Change list {"added", "modified", "deleted": [s3 uris], "unchanged": count}
+        of documents (a changed sidecar marks its document modified) for a
+        targeted knowledge base ingestion job
+    """
+    previous = load_manifest(database_name)
+    current = {key: hashlib.sha256(content.encode("utf-8")).hexdigest() for key, content in documents.items()}
+    changes = {"added": [], "modified": [], "deleted": [], "unchanged": 0}
+
+    changed = set()
+    for key, content in documents.items():
+        if previous.get(key) == current[key]:
+            continue
+        content_type = "application/json" if key.endswith(METADATA_SUFFIX) else "text/plain"
+        s3_client.put_object(Bucket=S3_BUCKET, Key=key, Body=content, ContentType=content_type)
+        changed.add(document_of(key))
+        print(f"Uploaded schema: {key} to S3://{S3_BUCKET}/")
+
+    for key in sorted(changed):
+        changes["added" if key not in previous else "modified"].append(f"s3://{S3_BUCKET}/{key}")
+    changes["unchanged"] = sum(1 for key in current if document_of(key) == key and key not in changed)
+
+    # An empty extraction is far more likely an error than every table being dropped
+    if current:
+        for key in sorted(previous.keys() - current.keys()):
+            s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
+            if document_of(key) == key:
+                changes["deleted"].append(f"s3://{S3_BUCKET}/{key}")
+            print(f"Deleted schema: {key} from S3://{S3_BUCKET}/")
+    else:
+        current = previous
+
+    s3_client.put_object(
+        Bucket=ARTIFACT_BUCKET,
+        Key=f"{MANIFEST_PREFIX}{database_name}.json",
+        Body=json.dumps({"documents": current}, indent=2, sort_keys=True),
+        ContentType="application/json"
+    )
+    # Keep the knowledge base data source free of non-schema objects
+    s3_client.delete_object(Bucket=S3_BUCKET, Key=f"{LEGACY_MANIFEST_PREFIX}{database_name}.json")
+    return changes
+
+def schema_index_key(database_name):
+    return f"{INDEX_PREFIX}{database_name}.json.gz"
+
+def load_schema_index(database_name):
+    """
+    Loads the previous search index and the bucket it was found in, or
+    (None, None) on the first run. Falls back to an index left in S3_BUCKET
+    by earlier versions.
+    """
+    for bucket, key in ((ARTIFACT_BUCKET, schema_index_key(database_name)),
+                        (S3_BUCKET, f"{LEGACY_INDEX_PREFIX}{database_name}.json.gz")):
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=key)
+        except s3_client.exceptions.NoSuchKey:
+            continue
+        return json.loads(gzip.decompress(response["Body"].read())), bucket
+    return None, None
+
+def publish_schema_index(database_name, documents):
+    """
+    Writes the search index used by freight_audit's local schema retriever.
+
+    Embeddings of unchanged documents (same embedding_key: normalized text,
+    model and dimensions) are reused from the previous index; only new or
+    edited documents are embedded, through embedding_service. Nothing is
+    written when no document changed.
+
+    documents: {S3 key: content} as passed to publish_schema_documents.
+
+    Returns:
+        Number of documents embedded in this run
+    """
+    entries = []
+    for key in sorted(documents):
+        if document_of(key) != key:
+            continue
+        sidecar = documents.get(f"{key}{METADATA_SUFFIX}")
+        entries.append({
+            "key": key,
+            "hash": embedding_key(documents[key], EMBEDDING_MODEL_ID, EMBEDDING_DIMENSIONS),
+            "text": documents[key],
+            "metadata": json.loads(sidecar)["metadataAttributes"] if sidecar else {}
+        })
+    if not entries:
+        return 0
+
+    previous, previous_bucket = load_schema_index(database_name)
+    previous = previous or {}
+    reusable = {}
+    if previous.get("model") == EMBEDDING_MODEL_ID and previous.get("dimensions") == EMBEDDING_DIMENSIONS:
+        matrix = array("f", base64.b64decode(previous["vectors"]))
+        for i, entry in enumerate(previous["documents"]):
+            reusable[entry["hash"]] = matrix[i * EMBEDDING_DIMENSIONS:(i + 1) * EMBEDDING_DIMENSIONS]
+        # An index still in the legacy location is rewritten even when unchanged
+        if previous_bucket == ARTIFACT_BUCKET and [(e["key"], e["hash"]) for e in previous["documents"]] == [(e["key"], e["hash"]) for e in entries] \
+                and all(e["metadata"] == p.get("metadata", {}) for e, p in zip(entries, previous["documents"])):
+            return 0
+
+    missing = list({entry["hash"]: entry for entry in entries if entry["hash"] not in reusable}.values())
+    for entry, vector in zip(missing, embedding_service.embed_many(entry["text"] for entry in missing)):
+        reusable[entry["hash"]] = array("f", vector)
+
+    vectors = array("f")
+    for entry in entries:
+        vectors.extend(reusable[entry["hash"]])
+    s3_client.put_object(
+        Bucket=ARTIFACT_BUCKET,
+        Key=schema_index_key(database_name),
+        Body=gzip.compress(json.dumps({
+            "model": EMBEDDING_MODEL_ID,
+            "dimensions": EMBEDDING_DIMENSIONS,
+            "documents": entries,
+            "vectors": base64.b64encode(vectors.tobytes()).decode("ascii")
+        }).encode("utf-8")),
+        ContentType="application/gzip"
+    )
+    # Keep the knowledge base data source free of non-schema objects
+    s3_client.delete_object(Bucket=S3_BUCKET, Key=f"{LEGACY_INDEX_PREFIX}{database_name}.json.gz")
+    print(f"Uploaded schema index: s3://{ARTIFACT_BUCKET}/{schema_index_key(database_name)} "
+          f"({len(missing)} embedded, {len(entries) - len(missing)} reused)")
+    return len(missing)
+
+def fetch_table_schema_bulk(database_name, backend):
+    """
+    Fetches the columns of every table in one pass (a single Athena
+    information_schema query or paginated Glue get_tables calls).
+
+    Returns:
+        {table name: {"description", "columns"}}
+    """
+    if backend == "glue":
+        schema_backend = get_schema_backend("glue")
+    else:
+        schema_backend = get_schema_backend("athena", output_location=S3_OUTPUT_LOCATION, engine=athena_engine)
+    return schema_backend.list_tables(database_name)
+
+def fetch_table_schema(database_name, bulk=True, backend=SCHEMA_BACKEND, profile=PROFILE_COLUMNS,
+                       build_index=BUILD_SCHEMA_INDEX):
+    """
+    Fetches table schema and publishes the changed documents to S3.
+
+    With profile=True every column is also profiled (distinct count, null
+    rate, range and frequent values) so the SQL generator sees real literals.
+    With build_index=True the local retriever's search index is refreshed.
+    """
+    if bulk or backend == "glue":
+        tables = fetch_table_schema_bulk(database_name, backend)
+    else:
+        tables = fetch_table_schema_per_table(database_name)
+
+    if profile:
+        ColumnProfiler(athena_engine).annotate(database_name, tables)
+
+    documents = {}
+    for table_name, table in tables.items():
+        documents.update(build_schema_chunks(database_name, table_name, table["columns"], table["description"]))
+    changes = publish_schema_documents(database_name, documents)
+    if build_index:
+        changes["embedded"] = publish_schema_index(database_name, documents)
+    return changes
+
+def fetch_table_schema_per_table(database_name):
+    """Fetches the column details with one information_schema query per table."""
+    tables = {}
+
     # 1. Fetch all tables
     query_tables = f"SELECT table_name FROM information_schema.tables WHERE table_schema = '{database_name}';"
     query_id = execute_athena_query(database_name, query_tables)
-    tables = get_query_results(query_id)
-
-    for table_row in tables:
-        table_name = table_row[0]
-        file_name = f"{database_name}_{table_name}.txt"
-        content = f"Database: {database_name}\nTable: {database_name}.{table_name}\n"
-
-        # 2. Fetch table description
-        # query_desc = f"SELECT comment FROM information_schema.tables WHERE table_schema = '{database_name}' AND table_name = '{table_name}';"
-        # query_id = execute_athena_query(database_name, query_desc)
-        # table_desc = get_query_results(query_id)
-        # table_desc = table_desc[0][0] if table_desc else "No description available"
-        table_desc = "No description available"
-        content += f"Description: {table_desc}\n\nCOLUMNS:\n========\n\n"
-
-        # 3. Fetch column details
-        query_columns = f"""
+    table_rows = get_query_results(query_id)
+
+    # 3. Fetch column details, running the per-table queries concurrently
+    queries = (
+        (table_row[0], database_name, f"""
             SELECT column_name, data_type, comment
             FROM information_schema.columns
-            WHERE table_schema = '{database_name}' AND table_name = '{table_name}';
-        """
-        query_id = execute_athena_query(database_name, query_columns)
-        columns = get_query_results(query_id)
-
-        for col_name, col_type, col_desc in columns:
-            col_desc = col_desc if col_desc else "No description available"
-            content += f"{database_name}.{table_name}.{col_name} | Type: {col_type} | Description: {col_desc}\n\n"
+            WHERE table_schema = '{database_name}' AND table_name = '{table_row[0]}';
+        """)
+        for table_row in table_rows
+    )
+    for result in athena_engine.run_queries(queries):
+        if result.state != "SUCCEEDED":
+            raise Exception(f"Athena query failed: {result.state} {result.reason or ''}".rstrip())
+        tables[result.key] = {
+            "description": None,
+            "columns": [
+                {"name": col_name, "type": col_type, "comment": col_desc}
+                for col_name, col_type, col_desc in get_query_results(result.query_execution_id)
+            ]
+        }
 
-        # 4. Upload file to S3
-        s3_client.put_object(Bucket=S3_BUCKET, Key=f"{file_name}", Body=content)
-        print(f"Uploaded schema: {file_name} to S3://{S3_BUCKET}/")
+    return tables
 
 def lambda_handler(event, context):
     """AWS Lambda entry point."""
     #database_name = event.get("database_name", "your_database_name")  # Change default DB
     database_name = "pando-db-pg"
-    fetch_table_schema(database_name)
-    return {"statusCode": 200, "message": "Schema extraction completed!"}
+    # One information_schema query for all tables unless per-table mode is requested
+    bulk = event.get("schema_mode", "bulk") != "per_table"
+    changes = fetch_table_schema(
+        database_name,
+        bulk=bulk,
+        backend=event.get("schema_backend", SCHEMA_BACKEND),
+        profile=event.get("profile_columns", PROFILE_COLUMNS)
+    )
+    return {"statusCode": 200, "message": "Schema extraction completed!", "changes": changes}
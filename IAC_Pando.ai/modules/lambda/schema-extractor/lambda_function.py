@@ -1,152 +1,394 @@
-import boto3
-import pandas as pd
-import json
-import time
+import csv
 import io
+import json
 import os
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from schema_catalog import get_schema_backend  # common layer
+from athena_engine import AthenaQueryEngine  # common layer
+from s3_csv_writer import GzipCsvWriter  # common layer
+from column_profiler import ColumnProfiler, PROFILE_COLUMNS  # common layer
+from aws_clients import get_client  # common layer
 
 # AWS Clients
-athena_client = boto3.client("athena")
-s3_client = boto3.client("s3")
+athena_client = get_client("athena")
+s3_client = get_client("s3")
 
 # S3 Configuration
 S3_BUCKET = "athena-neptune-data"  # ✅ Remove trailing space  #os.environ['S3_BUCKET']  this is where the output csv files will go
 S3_TARGET_PATH = "neptune-nodes-data/"  # ✅ Use folder path, not URL
 S3_OUTPUT_LOCATION = "s3://pando-freight-agent/output/"     # used by athena, where the query results will go
 
-# Initialize global counters
-node_id_counter = 10000000
-rel_id_counter = 30000000
-table_ids = {}
-column_ids = {}
-table_nodes = []
-column_nodes = []
-table_column_rels = []
+# Bounded concurrent Athena execution (ATHENA_MAX_CONCURRENCY queries in flight)
+athena_engine = AthenaQueryEngine(S3_OUTPUT_LOCATION, athena_client=athena_client)
+
+# Where table metadata comes from: "athena" (information_schema) or "glue" (Data Catalog)
+SCHEMA_BACKEND = os.environ.get("SCHEMA_BACKEND", "athena")
+
+# Bulk loader CSV headers; properties a node type lacks are left empty
+NODE_FIELDS = [':ID', 'name:string', 'database:string', ':LABEL', 'table_name:string',
+               'data_type:string', 'comment:string', 'partition_key:bool',
+               'approx_distinct:long', 'null_rate:double', 'min_value:string', 'max_value:string',
+               'top_values:string']
+REL_FIELDS = [':ID', ':START_ID', ':END_ID', ':TYPE']
+# Column profile properties; they drift on every run, so they are left out of
+# the change hash and refreshed only by full exports or with a schema change
+PROFILE_FIELDS = {'approx_distinct:long', 'null_rate:double', 'min_value:string', 'max_value:string',
+                  'top_values:string'}
+
+# "full" rewrites the complete node/relationship files; "delta" writes only the
+# changes since the last exported snapshot
+EXPORT_MODE = os.environ.get("EXPORT_MODE", "full")
+
+# Everything under S3_TARGET_PATH is picked up by a bulk load of that prefix,
+# so working files (snapshots, legacy ID maps) go to the schema artifacts bucket
+ARTIFACT_BUCKET = os.environ.get("ARTIFACT_BUCKET", "pando-db-auto-schema-artifacts")
+SNAPSHOT_PREFIX = "schema-extractor/snapshot/"
+ID_MAP_PREFIX = "schema-extractor/id-map/"
+# Where earlier versions kept snapshots and ID maps, inside S3_TARGET_PATH;
+# read once and removed
+LEGACY_SNAPSHOT_PREFIX = f"{S3_TARGET_PATH}snapshot/"
+
+# Each delta run writes <timestamp>/load/ (the bulk load source for that run)
+# and <timestamp>/remove/ (IDs to drop via Gremlin), outside S3_TARGET_PATH
+DELTA_PREFIX = "neptune-delta-data/"
+# Where earlier versions wrote delta runs, inside S3_TARGET_PATH; moved on the next run
+LEGACY_DELTA_PREFIX = f"{S3_TARGET_PATH}delta/"
+
+# Files written by the counter-based export, whose numeric IDs are already in
+# Neptune (Concept -> Table/Column edges point at them). Objects found there
+# keep their numeric ID; only new objects get a hash-derived one. The files
+# are deleted once their IDs are stored in the ID maps.
+LEGACY_NODE_KEY = f"{S3_TARGET_PATH}updated_nodes.csv"
+LEGACY_REL_KEY = f"{S3_TARGET_PATH}updated_relationships.csv"
+
+def stable_id(kind, *parts):
+    """Hash-derived vertex/edge ID, identical on every run for the same schema object."""
+    digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:20]
+    return f"{kind}-{digest}"
+
+def resolve_id(ids, key):
+    """The ID already loaded for a schema object, or its hash-derived key for a new one."""
+    return (ids or {}).get(key, key)
+
+def content_hash(element):
+    """Hash of a node or relationship's schema properties (not its profile), used to detect changes."""
+    schema = {name: value for name, value in element.items() if name not in PROFILE_FIELDS}
+    return hashlib.sha1(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+def new_graph():
+    """Empty per-invocation graph: {"nodes": {id: node}, "relationships": {id: rel}}."""
+    return {"nodes": {}, "relationships": {}}
 
 def execute_athena_query(database, query):
     """Executes an Athena query and waits for results."""
-    response = athena_client.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={"Database": database},
-        ResultConfiguration={"OutputLocation": S3_OUTPUT_LOCATION}
-    )
-    query_execution_id = response["QueryExecutionId"]
-    
-    while True:
-        status = athena_client.get_query_execution(QueryExecutionId=query_execution_id)
-        state = status["QueryExecution"]["Status"]["State"]
-        if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
-            break
-        time.sleep(2)
-    
-    if state != "SUCCEEDED":
-        raise Exception(f"Athena query failed: {state}")
-    
-    return query_execution_id
+    return athena_engine.run(database, query)
 
 def get_query_results(query_execution_id):
-    """Fetches Athena query results."""
-    results = athena_client.get_query_results(QueryExecutionId=query_execution_id)
-    processed_results = []
-    for row in results["ResultSet"]["Rows"]:
-        processed_row = [col.get("VarCharValue", "NULL") for col in row["Data"]]
-        processed_results.append(processed_row)
-    
-    return processed_results[1:]  # Skip header row
+    """Fetches all pages of Athena query results."""
+    return athena_engine.get_results(query_execution_id)  # Header row skipped
 
-def fetch_table_schema(database_name):
-    """Fetches table schema and stores nodes and relationships."""
-    global node_id_counter, rel_id_counter
-    
+def add_table(graph, database_name, table_name, columns, ids=None):
+    """
+    Adds a Table node, its Column nodes and HAS_COLUMN relationships.
+
+    columns: dicts with "name" and "type", plus "comment" and "partition_key"
+    when the metadata source provides them and "profile" when profiling ran.
+    Top values are stored as a JSON array string.
+    ids: {hash-derived key: legacy ID} from load_id_map; mapped objects keep
+    their legacy ID.
+    """
+    table_key = stable_id("table", database_name, table_name)
+    table_id = resolve_id(ids, table_key)
+    graph["nodes"][table_id] = {
+        ':ID': table_id,
+        'name:string': table_name,
+        'database:string': database_name,
+        ':LABEL': 'Table'
+    }
+
+    for column in columns:
+        column_name, data_type = column["name"], column["type"]
+        column_key = stable_id("column", database_name, table_name, column_name)
+        column_id = resolve_id(ids, column_key)
+        column_node = {
+            ':ID': column_id,
+            'name:string': column_name,
+            'table_name:string': table_name,
+            'database:string': database_name,
+            'data_type:string': data_type,
+            ':LABEL': 'Column'
+        }
+        if column.get("comment"):
+            column_node['comment:string'] = column["comment"]
+        if "partition_key" in column:
+            column_node['partition_key:bool'] = column["partition_key"]
+        profile = column.get("profile") or {}
+        if profile.get("approx_distinct") is not None:
+            column_node['approx_distinct:long'] = profile["approx_distinct"]
+        if profile.get("null_rate") is not None:
+            column_node['null_rate:double'] = profile["null_rate"]
+        if profile.get("min") is not None:
+            column_node['min_value:string'] = profile["min"]
+        if profile.get("max") is not None:
+            column_node['max_value:string'] = profile["max"]
+        if profile.get("top_values"):
+            column_node['top_values:string'] = json.dumps([value for value, _ in profile["top_values"]])
+        graph["nodes"][column_id] = column_node
+
+        rel_id = resolve_id(ids, stable_id("rel", table_key, "HAS_COLUMN", column_key))
+        graph["relationships"][rel_id] = {
+            ':ID': rel_id,
+            ':START_ID': table_id,
+            ':END_ID': column_id,
+            ':TYPE': 'HAS_COLUMN'
+        }
+
+def fetch_table_schema(database_name, backend=SCHEMA_BACKEND, profile=PROFILE_COLUMNS, ids=None):
+    """
+    Fetches table schema and returns its nodes and relationships.
+
+    With profile=True Column nodes also carry value profiles (distinct count,
+    null rate, range and frequent values). ids maps hash-derived keys to the
+    legacy IDs existing objects keep (see load_id_map).
+    """
+    if backend == "glue":
+        # Paginated Glue get_tables calls; includes comments and partition keys
+        tables = get_schema_backend("glue").list_tables(database_name)
+    else:
+        tables = fetch_athena_columns(database_name)
+
+    if profile:
+        ColumnProfiler(athena_engine).annotate(database_name, tables)
+
+    graph = new_graph()
+    for table_name, table in tables.items():
+        add_table(graph, database_name, table_name, table["columns"], ids)
+    return graph
+
+def fetch_athena_columns(database_name):
+    """Fetches {table name: {"columns": [...]}} with one information_schema query per table."""
+    tables = {}
     query_tables = f"""
         SELECT table_name 
         FROM information_schema.tables 
         WHERE table_schema = '{database_name}';
     """
     query_id = execute_athena_query(database_name, query_tables)
-    tables = get_query_results(query_id)
+    table_rows = get_query_results(query_id)
     
-    for table_row in tables:
-        table_name = table_row[0]
-        
-        if table_name not in table_ids:
-            table_ids[table_name] = str(node_id_counter)
-            node_id_counter += 1
-            table_nodes.append({
-                ':ID': table_ids[table_name],
-                'name:string': table_name,
-                'database:string': database_name,
-                ':LABEL': 'Table'
-            })
-        
-        query_columns = f"""
+    # Column queries for all tables run concurrently; tables are added as they finish
+    queries = (
+        (table_row[0], database_name, f"""
             SELECT column_name, data_type 
             FROM information_schema.columns 
-            WHERE table_schema = '{database_name}' AND table_name = '{table_name}';
-        """
-        query_id = execute_athena_query(database_name, query_columns)
-        columns = get_query_results(query_id)
-        
-        if table_name not in column_ids:
-            column_ids[table_name] = {}
+            WHERE table_schema = '{database_name}' AND table_name = '{table_row[0]}';
+        """)
+        for table_row in table_rows
+    )
+    for result in athena_engine.run_queries(queries):
+        if result.state != "SUCCEEDED":
+            raise Exception(f"Athena query failed: {result.state} {result.reason or ''}".rstrip())
+        columns = get_query_results(result.query_execution_id)
         
-        for column_info in columns:
-            column_name, data_type = column_info
-            
-            if column_name not in column_ids[table_name]:
-                column_ids[table_name][column_name] = str(node_id_counter)
-                node_id_counter += 1
-                column_nodes.append({
-                    ':ID': column_ids[table_name][column_name],
-                    'name:string': column_name,
-                    'table_name:string': table_name,
-                    'database:string': database_name,
-                    'data_type:string': data_type,
-                    ':LABEL': 'Column'
-                })
-            
-            table_column_rels.append({
-                ':ID': str(rel_id_counter),
-                ':START_ID': table_ids[table_name],
-                ':END_ID': column_ids[table_name][column_name],
-                ':TYPE': 'HAS_COLUMN'
-            })
-            rel_id_counter += 1
-
-def lambda_handler(event, context):
-    """AWS Lambda entry point."""
-    database_name = event.get("database_name", "pando-db-pg")
+        tables[result.key] = {"columns": [
+            {"name": column_name, "type": data_type} for column_name, data_type in columns
+        ]}
 
-    fetch_table_schema(database_name)  # Ensure this function is defined
+    return tables
 
-    # Convert data to DataFrame
-    df_nodes = pd.DataFrame(table_nodes + column_nodes)
-    df_rels = pd.DataFrame(table_column_rels)
+def read_legacy_csv(key):
+    """Rows of a file from the counter-based export, or [] when there is none."""
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return []
+    return list(csv.DictReader(io.StringIO(response["Body"].read().decode("utf-8"))))
 
-    # **Use in-memory buffer for CSV upload**
-    node_csv_buffer = io.StringIO()
-    rel_csv_buffer = io.StringIO()
+def legacy_id_maps():
+    """
+    Maps hash-derived keys to the numeric IDs the counter-based export gave
+    tables, columns and HAS_COLUMN relationships, per database:
+    {database: {hash-derived key: legacy ID}}.
+    """
+    maps = {}
+    legacy_keys = {}  # legacy node ID -> (database, hash-derived key)
+    for row in read_legacy_csv(LEGACY_NODE_KEY):
+        database_name = row.get('database:string')
+        if row.get(':LABEL') == 'Table':
+            key = stable_id("table", database_name, row['name:string'])
+        elif row.get(':LABEL') == 'Column':
+            key = stable_id("column", database_name, row['table_name:string'], row['name:string'])
+        else:
+            continue
+        maps.setdefault(database_name, {}).setdefault(key, row[':ID'])
+        legacy_keys[row[':ID']] = (database_name, key)
 
-    df_nodes.to_csv(node_csv_buffer, index=False, encoding='utf-8')
-    df_rels.to_csv(rel_csv_buffer, index=False, encoding='utf-8')
+    for row in read_legacy_csv(LEGACY_REL_KEY):
+        start, end = legacy_keys.get(row.get(':START_ID')), legacy_keys.get(row.get(':END_ID'))
+        if start and end and row.get(':TYPE') == 'HAS_COLUMN':
+            maps[start[0]].setdefault(stable_id("rel", start[1], "HAS_COLUMN", end[1]), row[':ID'])
+    return maps
 
-    # Move cursor to start of buffer
-    node_csv_buffer.seek(0)
-    rel_csv_buffer.seek(0)
+def read_json_gz(bucket, key):
+    """Parsed gzip JSON object, or None when there is none."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(gzip.decompress(response["Body"].read()))
 
-    # Upload CSV to S3 directly
+def write_json_gz(bucket, key, value):
     s3_client.put_object(
-        Bucket=S3_BUCKET,
-        Key=f"{S3_TARGET_PATH}updated_nodes.csv",
-        Body=node_csv_buffer.getvalue()
+        Bucket=bucket,
+        Key=key,
+        Body=gzip.compress(json.dumps(value).encode("utf-8")),
+        ContentType="application/gzip"
     )
-    s3_client.put_object(
-        Bucket=S3_BUCKET,
-        Key=f"{S3_TARGET_PATH}updated_relationships.csv",
-        Body=rel_csv_buffer.getvalue()
+
+def load_id_map(database_name):
+    """
+    Loads {hash-derived key: legacy ID} for a database.
+
+    On the first run the maps of every database in the counter-based export's
+    files are stored in ARTIFACT_BUCKET and those files are deleted, so a
+    bulk load of S3_TARGET_PATH no longer imports them next to the current
+    export. A map left under S3_TARGET_PATH by earlier versions is moved.
+    """
+    key = f"{ID_MAP_PREFIX}{database_name}.json.gz"
+    ids = read_json_gz(ARTIFACT_BUCKET, key)
+    if ids is not None:
+        return ids
+
+    legacy_key = f"{LEGACY_SNAPSHOT_PREFIX}{database_name}.ids.json.gz"
+    ids = read_json_gz(S3_BUCKET, legacy_key)
+    if ids is not None:
+        write_json_gz(ARTIFACT_BUCKET, key, ids)
+        s3_client.delete_object(Bucket=S3_BUCKET, Key=legacy_key)
+        return ids
+
+    maps = legacy_id_maps()
+    maps.setdefault(database_name, {})
+    for name, database_ids in maps.items():
+        write_json_gz(ARTIFACT_BUCKET, f"{ID_MAP_PREFIX}{name}.json.gz", database_ids)
+    for legacy_file in (LEGACY_NODE_KEY, LEGACY_REL_KEY):
+        s3_client.delete_object(Bucket=S3_BUCKET, Key=legacy_file)
+    return maps[database_name]
+
+def load_snapshot(database_name):
+    """
+    Loads {"nodes": {id: hash}, "relationships": {id: hash}} from the last
+    export. Falls back to a snapshot left under S3_TARGET_PATH by earlier
+    versions.
+    """
+    for bucket, key in ((ARTIFACT_BUCKET, f"{SNAPSHOT_PREFIX}{database_name}.json.gz"),
+                        (S3_BUCKET, f"{LEGACY_SNAPSHOT_PREFIX}{database_name}.json.gz")):
+        snapshot = read_json_gz(bucket, key)
+        if snapshot is not None:
+            return snapshot
+    return new_graph()
+
+def save_snapshot(database_name, graph):
+    """Stores the content hashes of the exported graph for the next delta run."""
+    snapshot = {
+        kind: {element_id: content_hash(element) for element_id, element in elements.items()}
+        for kind, elements in graph.items()
+    }
+    write_json_gz(ARTIFACT_BUCKET, f"{SNAPSHOT_PREFIX}{database_name}.json.gz", snapshot)
+    # Keep the bulk load prefix free of working files
+    s3_client.delete_object(Bucket=S3_BUCKET, Key=f"{LEGACY_SNAPSHOT_PREFIX}{database_name}.json.gz")
+
+def diff_graph(graph, snapshot):
+    """
+    Compares the current graph against the last snapshot.
+
+    Returns:
+        {"nodes" / "relationships": {"add": [elements], "remove": [ids]}};
+        "add" also holds elements whose properties changed
+    """
+    delta = {}
+    for kind, elements in graph.items():
+        previous = snapshot.get(kind, {})
+        delta[kind] = {
+            "add": [e for element_id, e in elements.items() if previous.get(element_id) != content_hash(e)],
+            "remove": [element_id for element_id in previous if element_id not in elements]
+        }
+    return delta
+
+def export_full(graph):
+    """Writes the complete node and relationship files. Returns the written keys."""
+    node_key = f"{S3_TARGET_PATH}updated_nodes.csv.gz"
+    rel_key = f"{S3_TARGET_PATH}updated_relationships.csv.gz"
+    # Stream rows through csv + gzip into multipart uploads; no intermediate copies
+    with GzipCsvWriter(s3_client, S3_BUCKET, node_key, NODE_FIELDS) as writer:
+        writer.writerows(graph["nodes"].values())
+    with GzipCsvWriter(s3_client, S3_BUCKET, rel_key, REL_FIELDS) as writer:
+        writer.writerows(graph["relationships"].values())
+    return [node_key, rel_key]
+
+def export_delta(delta):
+    """
+    Writes add files to <run>/load/ (bulk load that folder alone, with
+    updateSingleCardinalityProperties so changed properties are overwritten)
+    and remove files to <run>/remove/ (IDs to drop via Gremlin). Empty files
+    are skipped. Returns the written keys.
+    """
+    prefix = f"{DELTA_PREFIX}{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}/"
+    files = [
+        (f"{prefix}load/nodes_add.csv.gz", NODE_FIELDS, delta["nodes"]["add"]),
+        (f"{prefix}load/relationships_add.csv.gz", REL_FIELDS, delta["relationships"]["add"]),
+        (f"{prefix}remove/nodes_remove.csv.gz", [':ID'], [{':ID': i} for i in delta["nodes"]["remove"]]),
+        (f"{prefix}remove/relationships_remove.csv.gz", [':ID'], [{':ID': i} for i in delta["relationships"]["remove"]]),
+    ]
+    written = []
+    for key, fields, rows in files:
+        if rows:
+            with GzipCsvWriter(s3_client, S3_BUCKET, key, fields) as writer:
+                writer.writerows(rows)
+            written.append(key)
+    return written
+
+def move_legacy_deltas():
+    """Moves delta runs left under S3_TARGET_PATH by earlier versions to the DELTA_PREFIX layout."""
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=LEGACY_DELTA_PREFIX):
+        for item in page.get("Contents", []):
+            run, _, name = item["Key"][len(LEGACY_DELTA_PREFIX):].partition("/")
+            folder = "remove" if name.endswith("_remove.csv.gz") else "load"
+            s3_client.copy_object(
+                Bucket=S3_BUCKET,
+                Key=f"{DELTA_PREFIX}{run}/{folder}/{name}",
+                CopySource={"Bucket": S3_BUCKET, "Key": item["Key"]}
+            )
+            s3_client.delete_object(Bucket=S3_BUCKET, Key=item["Key"])
+
+def lambda_handler(event, context):
+    """AWS Lambda entry point."""
+    database_name = event.get("database_name", "pando-db-pg")
+    move_legacy_deltas()
+
+    graph = fetch_table_schema(
+        database_name,
+        backend=event.get("schema_backend", SCHEMA_BACKEND),
+        profile=event.get("profile_columns", PROFILE_COLUMNS),
+        ids=load_id_map(database_name)
     )
 
+    if event.get("export_mode", EXPORT_MODE) == "delta":
+        delta = diff_graph(graph, load_snapshot(database_name))
+        written = export_delta(delta)
+        summary = {kind: {op: len(items) for op, items in ops.items()} for kind, ops in delta.items()}
+        target = DELTA_PREFIX
+    else:
+        written = export_full(graph)
+        summary = {kind: {"add": len(elements)} for kind, elements in graph.items()}
+        target = S3_TARGET_PATH
+    save_snapshot(database_name, graph)
+
     return {
         "statusCode": 200,
-        "message": f"Schema extraction completed! Files uploaded to s3://{S3_BUCKET}/{S3_TARGET_PATH}updated_nodes.csv"
+        "message": f"Schema extraction completed! Files uploaded to s3://{S3_BUCKET}/{target}",
+        "files": [f"s3://{S3_BUCKET}/{key}" for key in written],
+        "changes": summary
     }